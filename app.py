@@ -1,43 +1,22 @@
 import streamlit as st
-import pandas as pd
-import json
 from datetime import datetime
-import os
 from pathlib import Path
-import pycountry
-from streamlit_lottie import st_lottie
-from streamlit_option_menu import option_menu
-import requests
-from PIL import Image
-import base64
-from streamlit_extras.switch_page_button import switch_page
 from streamlit_extras.colored_header import colored_header
 import hashlib
+import html
 import uuid
-
-# Color Palette
-COLORS = {
-    "light": {
-        "primary": "#FF8DC7",  # Soft pink
-        "secondary": "#FFB3D1",  # Light pink
-        "accent": "#FF69B4",  # Hot pink
-        "background": "#FFF0F5",  # Lavender blush
-        "text": "#4A4A4A",  # Dark gray
-        "success": "#85D2B5",  # Mint green
-        "card_bg": "#FFFFFF",  # White for cards
-        "border": "#FFE4E1",  # Misty rose
-    },
-    "dark": {
-        "primary": "#FF69B4",  # Hot pink
-        "secondary": "#DB7093",  # Pale violet red
-        "accent": "#FF1493",  # Deep pink
-        "background": "#2F2F2F",  # Dark background
-        "text": "#FFFFFF",  # White text
-        "success": "#85D2B5",  # Mint green
-        "card_bg": "#3D3D3D",  # Darker gray for cards
-        "border": "#4A4A4A",  # Dark gray for borders
-    }
-}
+from culture_swap.assets import AssetCache, avatar_data_uri
+from culture_swap.bulk import export_ndjson, import_ndjson
+from culture_swap.ingredients import parse_pantry
+from culture_swap.media import MediaStore, media_refcounts, start_gc
+from culture_swap.variants import FEED_WIDTH, VariantPipeline
+from culture_swap.metrics import METRICS, is_admin, span, start_export
+from culture_swap.reactions import ReactionCounter
+from culture_swap.search import SearchIndex
+from culture_swap.snapshot import SnapshotStore
+from culture_swap.storage import COMMENT_PAGE_SIZE, RECIPE, STORY, open_storage
+from culture_swap.theme import COLORS, THEME_CSS
+from culture_swap.vocab import CULTURE_TAGS, DIETARY_TAGS, MEAL_TAGS, OCCASION_TAGS, SEASONS
 
 # Initialize theme in session state
 if 'theme' not in st.session_state:
@@ -49,79 +28,24 @@ if 'authenticated' not in st.session_state:
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 
-# Custom CSS for theme
-def get_theme_css():
-    colors = COLORS[st.session_state.theme]
-    return f"""
-    <style>
-        .stApp {{
-            background-color: {colors['background']};
-            color: {colors['text']};
-        }}
-        .stButton>button {{
-            background-color: {colors['primary']};
-            color: white;
-            border-radius: 20px;
-            transition: all 0.3s ease;
-        }}
-        .stButton>button:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        }}
-        .stTextInput>div>div>input {{
-            color: {colors['text']};
-            border-radius: 10px;
-        }}
-        .stSelectBox>div>div>input {{
-            color: {colors['text']};
-        }}
-        .feed-card {{
-            background-color: {colors['card_bg']};
-            padding: 20px;
-            border-radius: 15px;
-            border: 1px solid {colors['border']};
-            margin: 10px 0;
-            transition: all 0.3s ease;
-        }}
-        .feed-card:hover {{
-            transform: translateY(-5px);
-            box-shadow: 0 8px 16px rgba(0,0,0,0.1);
-        }}
-        .user-info {{
-            display: flex;
-            align-items: center;
-            margin-bottom: 10px;
-        }}
-        .user-avatar {{
-            width: 40px;
-            height: 40px;
-            border-radius: 50%;
-            margin-right: 10px;
-        }}
-        .timestamp {{
-            color: {colors['text']};
-            opacity: 0.7;
-            font-size: 0.8em;
-        }}
-        .interaction-buttons {{
-            display: flex;
-            gap: 10px;
-            margin-top: 10px;
-        }}
-        .stTabs {{
-            background-color: {colors['card_bg']};
-            border-radius: 10px;
-            padding: 10px;
-        }}
-    </style>
-    """
+# Tags this session's traces in the metrics
+if 'trace_session' not in st.session_state:
+    st.session_state.trace_session = uuid.uuid4().hex[:12]
+
+# Local animation cache, refreshed from the CDN in the background
+@st.cache_resource
+def get_assets():
+    return AssetCache(Path("data") / "cache" / "lottie")
 
 # Load Lottie animation
 def load_lottie_url(url):
-    r = requests.get(url)
-    if r.status_code != 200:
-        return None
-    return r.json()
+    with span("lottie"):
+        return get_assets().lottie(url)
+
+# streamlit_lottie is only needed on pages that show an animation
+def show_lottie(animation, height=200):
+    from streamlit_lottie import st_lottie
+    st_lottie(animation, height=height)
 
 # Set up page config
 st.set_page_config(
@@ -130,30 +54,65 @@ st.set_page_config(
     layout="wide"
 )
 
+# Trace every run; written to CULTURE_SWAP_METRICS_DIR when it is set
+@st.cache_resource
+def get_metrics_exporter():
+    return start_export()
+
+get_metrics_exporter()
+METRICS.begin_rerun("Browse" if st.session_state.authenticated else "Login", st.session_state.trace_session)
+
 # Inject custom CSS
-st.markdown(get_theme_css(), unsafe_allow_html=True)
+st.markdown(THEME_CSS[st.session_state.theme], unsafe_allow_html=True)
 
 # Create necessary directories
 data_dir = Path("data")
 data_dir.mkdir(exist_ok=True)
-recipes_file = data_dir / "recipes.json"
-stories_file = data_dir / "stories.json"
 media_dir = data_dir / "media"
 media_dir.mkdir(exist_ok=True)
-users_file = data_dir / "users.json"
+search_index_file = data_dir / "search_index.pkl"
+
+# One storage backend and content snapshot per process, shared by all sessions
+@st.cache_resource
+def get_storage():
+    return open_storage(data_dir)
+
+@st.cache_resource
+def get_snapshots():
+    return SnapshotStore(get_storage())
+
+snapshots = get_snapshots()
+
+# Heart clicks are coalesced in memory and written to storage in batches
+@st.cache_resource
+def get_reactions():
+    return ReactionCounter(get_snapshots())
+
+reactions = get_reactions()
+
+# Full-text index, saved to disk so restarts only index new posts
+@st.cache_resource
+def get_search_index():
+    return SearchIndex.load(search_index_file)
+
+search_index = get_search_index()
+
+# Uploads are stored by content hash; unreferenced files are collected in the background.
+# With static serving on, browsers stream videos from app/static/media instead.
+@st.cache_resource
+def get_media_store():
+    static_dir = Path(__file__).parent / "static" if st.get_option("server.enableStaticServing") else None
+    store = MediaStore(media_dir, static_dir, VariantPipeline())
+    content_snapshots = get_snapshots()
+    start_gc(store, lambda: media_refcounts(content_snapshots.current().content))
+    return store
 
 # Initialize or load users data
 def load_users():
-    if users_file.exists():
-        with open(users_file, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    with open(users_file, 'w') as f:
-        json.dump(users, f)
+    return snapshots.current().users
 
-users_db = load_users()
+with span("load_users"):
+    users_db = load_users()
 
 # Hash password
 def hash_password(password):
@@ -165,13 +124,14 @@ def register_user(username, password, email):
         return False, "Username already exists"
     
     hashed_pwd = hash_password(password)
-    users_db[username] = {
+    record = {
         "password": hashed_pwd,
         "email": email,
         "created_at": datetime.now().strftime("%Y-%m-%d"),
         "id": str(uuid.uuid4())
     }
-    save_users(users_db)
+    if not snapshots.add_user(username, record):
+        return False, "Username already exists"
     return True, "Registration successful"
 
 def login_user(username, password):
@@ -189,6 +149,39 @@ def logout_user():
     st.session_state.authenticated = False
     st.session_state.current_user = None
 
+# This session's last runs and the process-wide metrics, for admins
+def show_debug_panel():
+    traces = METRICS.traces(st.session_state.trace_session)
+    if traces:
+        last = traces[-1]
+        st.caption(f"Last run: {last.page} ({last.scope}) in {last.duration * 1000:.1f} ms")
+        st.table([{"phase": s["name"], "ms": s["ms"]} for s in last.spans])
+        if last.counts:
+            st.json(last.counts, expanded=False)
+        st.caption("Recent runs (ms): " + ", ".join(f"{t.duration * 1000:.0f}" for t in traces[-10:]))
+    st.download_button("Download metrics (Prometheus)", METRICS.prometheus(), "metrics.prom")
+    st.download_button("Download traces (JSONL)", METRICS.jsonl(), "traces.jsonl")
+
+# NDJSON archives in and out, for admins; tools/bulk.py does the same from a shell
+def show_bulk_panel():
+    archive = st.file_uploader("NDJSON archive", type=["ndjson", "jsonl"], key="bulk_archive")
+    if archive is not None and st.button("Import archive"):
+        bar = st.progress(0.0, text="Importing...")
+
+        def show_progress(report):
+            bar.progress(min(archive.tell() / max(archive.size, 1), 1.0),
+                         text=f"Line {report.lines}: {report.imported} imported, {report.rejected} rejected")
+
+        report = import_ndjson(get_storage(), archive, progress=show_progress)
+        st.success(f"Imported {report.imported} posts ({report.skipped} were already here)")
+        if report.rejected:
+            st.warning(f"{report.rejected} lines rejected")
+            st.table([{"line": number, "error": error} for number, error in report.rejects])
+    if st.button("Prepare export"):
+        st.session_state.bulk_export = "".join(export_ndjson(get_storage()))
+    if 'bulk_export' in st.session_state:
+        st.download_button("Download NDJSON", st.session_state.bulk_export, "culture_swap.ndjson")
+
 # Authentication UI
 if not st.session_state.authenticated:
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -202,7 +195,7 @@ if not st.session_state.authenticated:
         # Load welcome animation
         welcome_animation = load_lottie_url("https://assets3.lottiefiles.com/packages/lf20_UJNc2t.json")
         if welcome_animation:
-            st_lottie(welcome_animation, height=200)
+            show_lottie(welcome_animation)
         
         tab1, tab2 = st.tabs(["Login", "Register"])
         
@@ -252,6 +245,11 @@ else:
         if st.button("Logout"):
             logout_user()
             st.rerun()
+        if is_admin(st.session_state.current_user):
+            if st.toggle("🛠 Debug panel"):
+                show_debug_panel()
+            with st.expander("📦 Bulk import / export"):
+                show_bulk_panel()
 
     # Header section with animation
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -263,6 +261,7 @@ else:
         )
 
     # Navigation with animations
+    from streamlit_option_menu import option_menu
     page = option_menu(
         menu_title=None,
         options=["Browse", "Add Recipe", "Add Story"],
@@ -282,46 +281,23 @@ else:
             "nav-link-selected": {"background-color": COLORS[st.session_state.theme]['secondary']},
         }
     )
+    METRICS.tag(page=page)
 
-    # Initialize session state
-    if 'recipes' not in st.session_state:
-        st.session_state.recipes = []
-    
-    if 'stories' not in st.session_state:
-        st.session_state.stories = []
-
-    # Load existing data
+    # Load existing data (shared snapshot, only rebuilt when storage changes)
     def load_data():
-        if recipes_file.exists():
-            with open(recipes_file, 'r') as f:
-                st.session_state.recipes = json.load(f)
-        if stories_file.exists():
-            with open(stories_file, 'r') as f:
-                st.session_state.stories = json.load(f)
-
-    # Save data
-    def save_data():
-        with open(recipes_file, 'w') as f:
-            json.dump(st.session_state.recipes, f)
-        with open(stories_file, 'w') as f:
-            json.dump(st.session_state.stories, f)
+        with span("load_data"):
+            snapshot = snapshots.current()
+            if search_index.sync(snapshot.content):
+                search_index.save_later(search_index_file)
+        return snapshot
 
     # Load existing data at startup
-    load_data()
-
-    # Get all countries for cultural tags
-    CULTURE_TAGS = [country.name for country in pycountry.countries]
-    MEAL_TAGS = ["Breakfast", "Lunch", "Dinner", "Dessert", "Snack", "Appetizer", "Beverage"]
-    DIETARY_TAGS = ["Vegetarian", "Vegan", "Gluten-Free", "Kid-Friendly", "Dairy-Free", "Nut-Free", "Halal", "Kosher"]
-    OCCASION_TAGS = ["Festival", "Wedding", "Birthday", "Holiday", "Everyday", "Religious", "Celebration"]
-    SEASONS = ["Spring", "Summer", "Fall", "Winter"]
+    snapshot = load_data()
 
     def save_uploaded_file(uploaded_file):
         if uploaded_file is not None:
-            file_path = media_dir / uploaded_file.name
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            return str(file_path)
+            with span("media"):
+                return get_media_store().ingest(uploaded_file, uploaded_file.name)
         return None
 
     if page == "Add Recipe":
@@ -330,12 +306,34 @@ else:
         # Load cooking animation
         cooking_animation = load_lottie_url("https://assets5.lottiefiles.com/packages/lf20_tfb3estd.json")
         if cooking_animation:
-            st_lottie(cooking_animation, height=200)
+            show_lottie(cooking_animation)
         
-        with st.form("recipe_form"):
+        # Appends a suggested ingredient to the list and clears the lookup
+        def add_ingredient(term):
+            current = st.session_state.get("recipe_ingredients", "").rstrip("\n")
+            st.session_state.recipe_ingredients = f"{current}\n{term}" if current else term
+            st.session_state.ingredient_lookup = ""
+
+        # A fragment rather than a form, so ingredient suggestions update as
+        # you type without rerunning the page around it
+        @st.fragment
+        def recipe_editor():
             title = st.text_input("Recipe Title")
             description = st.text_area("Description and Story Behind the Recipe")
-            ingredients = st.text_area("Ingredients (one per line)")
+            ingredients = st.text_area("Ingredients (one per line)", key="recipe_ingredients")
+
+            # Autocomplete from the ingredients other recipes already use
+            lookup = st.text_input("Find an ingredient", key="ingredient_lookup", placeholder="Start typing, e.g. tom")
+            if lookup.strip():
+                with span("autocomplete"):
+                    suggestions = snapshots.current().ingredient_index.complete(lookup)
+                if suggestions:
+                    for col, term in zip(st.columns(len(suggestions)), suggestions):
+                        with col:
+                            st.button(term, key=f"suggest_{term}", on_click=add_ingredient, args=(term,))
+                else:
+                    st.caption("No recipe uses that yet - type it into the list above.")
+
             instructions = st.text_area("Cooking Instructions")
             
             # Media upload
@@ -350,7 +348,7 @@ else:
                 dietary = st.multiselect("Dietary Tags", DIETARY_TAGS)
                 season = st.multiselect("Best Season", SEASONS)
             
-            submitted = st.form_submit_button("Share Recipe", use_container_width=True)
+            submitted = st.button("Share Recipe", use_container_width=True)
             
             if submitted and title and ingredients and instructions:
                 media_paths = [save_uploaded_file(f) for f in uploaded_files] if uploaded_files else []
@@ -368,18 +366,22 @@ else:
                     "hearts": 0,
                     "media": media_paths
                 }
-                st.session_state.recipes.append(recipe)
-                save_data()
+                with span("save"):
+                    snapshots.add_content(RECIPE, recipe)
+                    search_index.add(recipe)
+                    search_index.save_later(search_index_file)
                 st.success("Recipe shared successfully!")
                 st.balloons()
 
+        recipe_editor()
+
     elif page == "Add Story":
         st.header("Share a Cultural Story")
         
         # Load storytelling animation
         story_animation = load_lottie_url("https://assets9.lottiefiles.com/packages/lf20_M9p23l.json")
         if story_animation:
-            st_lottie(story_animation, height=200)
+            show_lottie(story_animation)
         
         with st.form("story_form"):
             title = st.text_input("Story Title")
@@ -406,12 +408,16 @@ else:
                     "hearts": 0,
                     "media": media_paths
                 }
-                st.session_state.stories.append(story_entry)
-                save_data()
+                with span("save"):
+                    snapshots.add_content(STORY, story_entry)
+                    search_index.add(story_entry)
+                    search_index.save_later(search_index_file)
                 st.success("Story shared successfully!")
                 st.balloons()
 
     else:  # Browse page
+        from culture_swap.feed import PAGE_SIZE as FEED_PAGE_SIZE
+
         st.header("📱 Your Culture Feed")
         
         # Add story/recipe quick action buttons
@@ -428,63 +434,91 @@ else:
                 else:
                     st.switch_page("Add Story")
 
-        # Filters with animation
-        with st.expander("🔍 Filter Your Feed", expanded=False):
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                filter_culture = st.multiselect("Culture", CULTURE_TAGS)
-            with col2:
-                filter_season = st.multiselect("Season", SEASONS)
-            with col3:
-                filter_dietary = st.multiselect("Dietary", DIETARY_TAGS)
-
-        # Combined feed of recipes and stories
-        all_content = []
-        
-        # Add recipes to content
-        for recipe in st.session_state.recipes:
-            all_content.append({
-                "type": "recipe",
-                "content": recipe,
-                "date": datetime.strptime(recipe['date_added'], "%Y-%m-%d"),
-                "author": recipe.get('author', 'Anonymous')
-            })
-        
-        # Add stories to content
-        for story in st.session_state.stories:
-            all_content.append({
-                "type": "story",
-                "content": story,
-                "date": datetime.strptime(story['date_added'], "%Y-%m-%d"),
-                "author": story.get('author', 'Anonymous')
-            })
-        
-        # Sort content by date
-        all_content.sort(key=lambda x: x['date'], reverse=True)
-
-        # Display feed
-        for item in all_content:
-            # Apply filters
-            content = item['content']
-            if ((filter_culture and not any(tag in content.get("culture_tags", []) for tag in filter_culture)) or
-                (filter_season and not any(tag in content.get("season", []) for tag in filter_season)) or
-                (filter_dietary and "dietary_tags" in content and not any(tag in content["dietary_tags"] for tag in filter_dietary))):
-                continue
-
+        # Runs as the Post button's callback, before the card is redrawn with the new count
+        def post_comment(content_id):
+            text = st.session_state[f"comment_text_{content_id}"].strip()
+            if text:
+                snapshots.add_comment(content_id, {
+                    "author": st.session_state.current_user,
+                    "text": text,
+                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                })
+
+        def show_more_comments(content_id):
+            pages_key = f"comment_pages_{content_id}"
+            st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+
+        # Oldest first, one page more each time "Show more" is clicked
+        def show_comments(content_id):
+            shown = st.session_state.get(f"comment_pages_{content_id}", 1) * COMMENT_PAGE_SIZE
+            with span("comments"):
+                comments = get_storage().list_comments(content_id, limit=shown + 1)
+            for _, comment in comments[:shown]:
+                st.markdown(f"**{html.escape(comment['author'])}** · <span class=\"timestamp\">{comment['created_at']}</span>",
+                            unsafe_allow_html=True)
+                st.write(comment['text'])
+            if len(comments) > shown:
+                st.button("Show more comments", key=f"more_comments_{content_id}",
+                          on_click=show_more_comments, args=(content_id,))
+            elif not comments:
+                st.caption("No comments yet. Start the conversation!")
+
+            with st.form(f"comment_form_{content_id}", clear_on_submit=True):
+                st.text_area("Add a comment", max_chars=1000, key=f"comment_text_{content_id}")
+                st.form_submit_button("Post", on_click=post_comment, args=(content_id,))
+
+        # Approximate neighbours from the snapshot's MinHash index, only looked
+        # up while the panel is open
+        def show_similar(content_id):
+            snapshot = snapshots.current()
+            with span("similar"):
+                matches = snapshot.similarity_index.similar(snapshot.tag_index.docnos[content_id])
+            if not matches:
+                st.caption("Nothing similar yet. Share one!")
+            for similar_id, similarity in matches:
+                similar_item = snapshot.feed_item(similar_id)
+                icon = "📖" if similar_item.type == 'recipe' else "📚"
+                tags = ", ".join(similar_item.content.get('culture_tags', ()))
+                st.markdown(f"{icon} **{similar_item.content['title']}** · {similar_item.author}")
+                st.caption(f"{similarity:.0%} alike" + (f" · {tags}" if tags else ""))
+
+        # Served videos are plain <video> tags that load nothing until played;
+        # otherwise the file goes through the websocket as before
+        def show_video(media_path):
+            video_html = get_media_store().video_html(media_path)
+            if video_html is None:
+                st.video(media_path)
+            else:
+                st.markdown(video_html, unsafe_allow_html=True)
+
+        # The smallest variant that fills its column, linking to the original;
+        # the original itself until the variants have been made
+        def show_image(media_path, columns):
+            media_store = get_media_store()
+            width = FEED_WIDTH // columns
+            image_html = media_store.image_html(media_path, width)
+            if image_html is None:
+                st.image(media_store.image_for(media_path, width))
+            else:
+                st.markdown(image_html, unsafe_allow_html=True)
+
+        def render_feed_item(item):
+            content = item.content
+            METRICS.count("items_rendered_total", page="Browse")
             st.markdown(f"""
                 <div class="feed-card">
                     <div class="user-info">
-                        <img src="https://api.dicebear.com/6.x/avataaars/svg?seed={item['author']}" class="user-avatar">
+                        <img src="{avatar_data_uri(item.author)}" class="user-avatar">
                         <div>
-                            <strong>{item['author']}</strong><br>
-                            <span class="timestamp">{item['date'].strftime('%B %d, %Y')}</span>
+                            <strong>{html.escape(item.author)}</strong><br>
+                            <span class="timestamp">{item.date.strftime('%B %d, %Y')}</span>
                         </div>
                     </div>
                 </div>
             """, unsafe_allow_html=True)
 
             with st.container():
-                if item['type'] == 'recipe':
+                if item.type == 'recipe':
                     st.subheader(f"📖 {content['title']}")
                     st.write(content['description'])
                     
@@ -500,9 +534,9 @@ else:
                             for col, media_path in zip(media_cols, content['media']):
                                 with col:
                                     if media_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                                        st.image(media_path)
+                                        show_image(media_path, len(media_cols))
                                     elif media_path.lower().endswith('.mp4'):
-                                        st.video(media_path)
+                                        show_video(media_path)
                 else:  # Story
                     st.subheader(f"📚 {content['title']}")
                     st.write(content['story'])
@@ -512,9 +546,9 @@ else:
                         for col, media_path in zip(media_cols, content['media']):
                             with col:
                                 if media_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                                    st.image(media_path)
+                                    show_image(media_path, len(media_cols))
                                 elif media_path.lower().endswith('.mp4'):
-                                    st.video(media_path)
+                                    show_video(media_path)
 
                 # Tags and interactions
                 st.markdown("---")
@@ -525,9 +559,142 @@ else:
                     for tag in content.get('dietary_tags', []):
                         st.badge(f"Diet: {tag}")
                 with cols[1]:
-                    if st.button(f"❤️ {content['hearts']}", key=f"{item['type']}_{content['title']}"):
-                        content['hearts'] += 1
-                        save_data()
+                    # Counted in the click callback so the label already includes it
+                    if st.button(
+                        f"❤️ {reactions.count(content)}",
+                        key=f"heart_{content['id']}",
+                        on_click=reactions.add,
+                        args=(content['id'], st.session_state.current_user),
+                    ):
                         st.balloons()
                 with cols[2]:
-                    st.button("💬 Comment", key=f"comment_{item['type']}_{content['title']}") 
\ No newline at end of file
+                    thread_key = f"thread_{content['id']}"
+                    if st.button(f"💬 {content.get('comment_count', 0)}", key=f"comment_{content['id']}"):
+                        st.session_state[thread_key] = not st.session_state.get(thread_key, False)
+
+                # The thread is only read from storage while it is open
+                if st.session_state.get(thread_key):
+                    show_comments(content['id'])
+
+                if item.type == 'recipe':
+                    similar_key = f"similar_{content['id']}"
+                    if st.button("✨ More like this", key=f"more_like_{content['id']}"):
+                        st.session_state[similar_key] = not st.session_state.get(similar_key, False)
+                    if st.session_state.get(similar_key):
+                        show_similar(content['id'])
+
+        # Each card reruns on its own when its buttons are clicked, re-reading
+        # only its own post from the shared snapshot
+        @st.fragment
+        def feed_card(content_id):
+            with METRICS.fragment("card", "Browse", st.session_state.trace_session):
+                render_feed_item(snapshots.current().feed_item(content_id))
+
+        def load_more():
+            st.session_state.feed_pages += 1
+
+        def render_feed_panel():
+            snapshot = load_data()
+
+            search_query = st.text_input("🔎 Search recipes and stories", placeholder="Try a dish, an ingredient or a festival")
+            pantry = parse_pantry(st.text_input("🧺 Cook with what I have", placeholder="rice, tomatoes, onion"))
+            feed_order = st.radio("Order", ["🆕 Newest", "🔥 Trending"], horizontal=True, label_visibility="collapsed")
+
+            # Filters with animation, backed by the snapshot's tag index
+            tag_index = snapshot.tag_index
+            with st.expander("🔍 Filter Your Feed", expanded=False):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    # Only cultures that have been shared can match anything
+                    filter_culture = st.multiselect("Culture", tag_index.values("culture"))
+                with col2:
+                    filter_season = st.multiselect("Season", SEASONS)
+                with col3:
+                    filter_dietary = st.multiselect("Dietary", DIETARY_TAGS)
+
+                selected_tags = {"culture": filter_culture, "season": filter_season, "dietary": filter_dietary}
+                for col, facet in zip((col1, col2, col3), selected_tags):
+                    facet_counts = tag_index.counts(facet, selected_tags)
+                    with col:
+                        st.caption(" · ".join(f"{value} ({count})" for value, count in facet_counts.items() if count))
+
+            with span("filter"):
+                feed_mask = tag_index.to_array(tag_index.query(selected_tags))
+
+            # Start again from the first page whenever the search or filters change
+            feed_filters = (search_query, tuple(pantry), feed_order, tuple(filter_culture), tuple(filter_season), tuple(filter_dietary))
+            if st.session_state.get('feed_filters') != feed_filters:
+                st.session_state.feed_filters = feed_filters
+                st.session_state.feed_pages = 1
+
+            if pantry:
+                # Recipes missing the fewest ingredients first, within the tag filters
+                shown = st.session_state.feed_pages * FEED_PAGE_SIZE
+                ingredient_index = snapshot.ingredient_index
+                with span("cook_with"):
+                    matches = ingredient_index.cook_with(pantry, shown + 1, feed_mask)
+                with span("render"):
+                    for content_id, matched, total in matches[:shown]:
+                        missing = [
+                            term for term in ingredient_index.terms_of(tag_index.docnos[content_id])
+                            if term not in pantry
+                        ]
+                        note = f"🧺 You have {matched} of {total} ingredients"
+                        st.caption(f"{note} · still need: {', '.join(missing)}" if missing else f"{note} - nothing else needed!")
+                        feed_card(content_id)
+                has_more = len(matches) > shown
+                if not matches:
+                    st.info("No recipes use any of those ingredients yet.")
+            elif search_query.strip():
+                # Ranked search results, narrowed down by the tag filters
+                with span("search"):
+                    results = [
+                        content_id for content_id, _ in search_index.search(search_query)
+                        if content_id in snapshot
+                        and (feed_mask is None or feed_mask[tag_index.docnos[content_id]])
+                    ]
+                shown = st.session_state.feed_pages * FEED_PAGE_SIZE
+                with span("render"):
+                    for content_id in results[:shown]:
+                        feed_card(content_id)
+                has_more = len(results) > shown
+                if not results:
+                    st.info("No recipes or stories match your search.")
+            elif feed_order == "🔥 Trending":
+                # Hottest first by time-decayed hearts, kept in order as hearts arrive
+                cursor = None
+                with span("render"):
+                    for _ in range(st.session_state.feed_pages):
+                        content_ids, cursor = snapshot.trending.page(cursor, FEED_PAGE_SIZE, feed_mask, tag_index.docnos)
+                        for content_id in content_ids:
+                            feed_card(content_id)
+                        if cursor is None:
+                            break
+                has_more = cursor is not None
+            else:
+                # Display feed one page at a time, each page read from the previous page's cursor
+                cursor = None
+                with span("render"):
+                    for _ in range(st.session_state.feed_pages):
+                        items, cursor = snapshot.timeline.page(cursor, FEED_PAGE_SIZE, feed_mask)
+                        for item in items:
+                            feed_card(item.id)
+                        if cursor is None:
+                            break
+                has_more = cursor is not None
+
+            if has_more:
+                st.button("Load more", use_container_width=True, on_click=load_more)
+            elif snapshot.timeline:
+                st.caption("You're all caught up!")
+
+        # Search, filters and the feed they select rerun together without the
+        # page header and navigation above them
+        @st.fragment
+        def feed_panel():
+            with METRICS.fragment("feed", "Browse", st.session_state.trace_session):
+                render_feed_panel()
+
+        feed_panel()
+
+METRICS.end_rerun()
\ No newline at end of file
@@ -0,0 +1 @@
+"""Backend pieces of the Culture Swap app that do not depend on Streamlit."""
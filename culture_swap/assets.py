@@ -0,0 +1,136 @@
+"""Local cache for Lottie animations and generated author avatars.
+
+Nothing here touches the network on the render path. Animations are
+served from the on-disk cache and refreshed in a background thread with
+a timeout; avatars are small SVG identicons
+generated from the author's name.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from . import metrics
+
+FETCH_TIMEOUT = 5
+REFRESH_AFTER = 7 * 24 * 3600
+RETRY_AFTER = 300
+AVATAR_CACHE_SIZE = 2048
+
+
+def _url_key(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+class AssetCache:
+    """Lottie JSON looked up in memory, then on disk, then fetched in the background.
+
+    Fetched copies go to ``cache_dir`` and are refreshed once older than
+    ``refresh_after``.
+    """
+
+    def __init__(self, cache_dir, timeout=FETCH_TIMEOUT, refresh_after=REFRESH_AFTER):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.refresh_after = refresh_after
+        self._memory = {}
+        self._pending = set()
+        self._attempted = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="asset-refresh")
+
+    def _cache_path(self, url):
+        return self.cache_dir / f"{_url_key(url)}.json"
+
+    def _read(self, path):
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+                metrics.count("bytes_read_total", os.fstat(f.fileno()).st_size, source="lottie")
+                return data
+        except (OSError, ValueError):
+            return None
+
+    def lottie(self, url):
+        """Return the animation for ``url`` if a local copy exists, else None."""
+        data = self._memory.get(url)
+        if data is not None:
+            metrics.count("cache_requests_total", cache="lottie", result="memory")
+        else:
+            data = self._read(self._cache_path(url))
+            metrics.count("cache_requests_total", cache="lottie", result="disk" if data else "miss")
+            if data is not None:
+                self._memory[url] = data
+        self._refresh_if_stale(url)
+        return data
+
+    # Long-running processes serve from memory, so the cached file's age is
+    # looked at on hits too, but at most once per RETRY_AFTER
+    def _refresh_if_stale(self, url):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked.get(url, -RETRY_AFTER) < RETRY_AFTER:
+                return
+            self._checked[url] = now
+        try:
+            stale = time.time() - self._cache_path(url).stat().st_mtime > self.refresh_after
+        except OSError:
+            stale = True
+        if stale:
+            self.refresh(url)
+
+    def refresh(self, url):
+        """Fetch ``url`` in the background unless a fetch is already running."""
+        with self._lock:
+            now = time.monotonic()
+            if url in self._pending or now - self._attempted.get(url, -RETRY_AFTER) < RETRY_AFTER:
+                return
+            self._pending.add(url)
+            self._attempted[url] = now
+        self._executor.submit(self._fetch, url)
+
+    def _fetch(self, url):
+        import requests
+
+        try:
+            r = requests.get(url, timeout=self.timeout)
+            if r.status_code != 200:
+                return
+            data = r.json()
+            path = self._cache_path(url)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+            self._memory[url] = data
+        except (requests.RequestException, ValueError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+
+# Generate a deterministic 5x5 mirrored identicon for an author
+@lru_cache(maxsize=AVATAR_CACHE_SIZE)
+def avatar_data_uri(author):
+    digest = hashlib.sha256(author.encode()).digest()
+    hue = int.from_bytes(digest[:2], "big") % 360
+    cells = []
+    for row in range(5):
+        for col in range(3):
+            if digest[2 + row * 3 + col] % 2:
+                for x in {col, 4 - col}:
+                    cells.append(f'<rect x="{x}" y="{row}" width="1" height="1"/>')
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="-0.5 -0.5 6 6" shape-rendering="crispEdges">'
+        f'<rect x="-0.5" y="-0.5" width="6" height="6" fill="hsl({hue}, 45%, 92%)"/>'
+        f'<g fill="hsl({hue}, 60%, 50%)">{"".join(cells)}</g></svg>'
+    )
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode()).decode()
@@ -0,0 +1,190 @@
+"""Streaming bulk import and export of recipes and stories as NDJSON.
+
+Each line is one JSON object with a ``kind`` of ``recipe`` or ``story``.
+The other fields are the ones the Add Recipe and Add Story forms save.
+Records are checked against that schema, so tags must come from the same
+vocabularies as the forms and dates use the forms' format. Imports read
+the input one line at a time. Valid records are written in batches, one
+storage commit per kind per batch; invalid ones are reported with their
+line number and never stop the import. Exports are generators over the
+storage, so neither direction holds the whole archive in memory.
+
+Records without an ``id`` get one derived from their contents, so
+running the same file again skips what was already imported.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from .storage import CONTENT_KINDS, RECIPE, STORY
+from .vocab import CULTURE_TAGS, DIETARY_TAGS, MEAL_TAGS, OCCASION_TAGS, SEASONS
+
+BATCH_SIZE = 1000
+# Rejected lines kept on the report for display; the rest only reach on_reject
+REJECT_SAMPLES = 100
+DATE_FORMAT = "%Y-%m-%d"
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".mp4")
+
+# Field -> (required, type, vocabulary) for each kind; lists are lists of str.
+_COMMON = {
+    "id": (False, str, None),
+    "author": (False, str, None),
+    "title": (True, str, None),
+    "culture_tags": (False, list, frozenset(CULTURE_TAGS)),
+    "date_added": (False, str, None),
+    "hearts": (False, int, None),
+    "media": (False, list, None),
+}
+SCHEMAS = {
+    RECIPE: dict(
+        _COMMON,
+        description=(False, str, None),
+        ingredients=(True, list, None),
+        instructions=(True, str, None),
+        meal_type=(False, list, frozenset(MEAL_TAGS)),
+        dietary_tags=(False, list, frozenset(DIETARY_TAGS)),
+        season=(False, list, frozenset(SEASONS)),
+    ),
+    STORY: dict(
+        _COMMON,
+        story=(True, str, None),
+        occasion=(False, list, frozenset(OCCASION_TAGS)),
+    ),
+}
+
+
+class ImportReport:
+    """Running totals of an import; ``rejects`` holds the first ``(line, error)`` pairs."""
+
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.rejects = []
+
+
+def record_id(record):
+    """Stable id for a record that has none: a hash of its canonical JSON."""
+    canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def validate(record):
+    """Return ``(kind, item)`` in the forms' shape, or raise ValueError."""
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+    item = dict(record)
+    kind = item.pop("kind", None)
+    # An unhashable kind would make the lookup raise TypeError
+    if not isinstance(kind, str) or kind not in SCHEMAS:
+        raise ValueError(f"kind must be one of {', '.join(CONTENT_KINDS)}")
+    schema = SCHEMAS[kind]
+
+    unknown = set(item) - set(schema)
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(sorted(unknown))}")
+    for field, (required, expected, vocabulary) in schema.items():
+        value = item.get(field)
+        if value is None or value == "" or value == []:
+            if required:
+                raise ValueError(f"{field} is required")
+            continue
+        if expected is int and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            raise ValueError(f"{field} must be a non-negative integer")
+        if expected is not int and not isinstance(value, expected):
+            raise ValueError(f"{field} must be a {'list' if expected is list else 'string'}")
+        if expected is list:
+            if not all(isinstance(entry, str) for entry in value):
+                raise ValueError(f"{field} must be a list of strings")
+            if vocabulary is not None:
+                invalid = [entry for entry in value if entry not in vocabulary]
+                if invalid:
+                    raise ValueError(f"unknown {field}: {', '.join(invalid)}")
+
+    if item.get("date_added"):
+        try:
+            datetime.strptime(item["date_added"], DATE_FORMAT)
+        except ValueError:
+            raise ValueError(f"date_added must look like {datetime.now().strftime(DATE_FORMAT)}")
+    else:
+        item["date_added"] = datetime.now().strftime(DATE_FORMAT)
+    for path in item.get("media") or ():
+        if not path.lower().endswith(MEDIA_EXTENSIONS) or not os.path.isfile(path):
+            raise ValueError(f"media file not found: {path}")
+
+    # Fill in what the forms always write
+    for field, (_, expected, _) in schema.items():
+        if field not in ("id", "author") and item.get(field) is None:
+            item[field] = [] if expected is list else 0 if expected is int else ""
+    return kind, item
+
+
+def import_ndjson(storage, lines, batch_size=BATCH_SIZE, progress=None, on_reject=None):
+    """Validate and insert the records in ``lines``; returns an ``ImportReport``.
+
+    ``lines`` is any iterable of str or bytes lines, such as an open file.
+    Records whose id is already stored are skipped, and records without
+    one get ``record_id``, so an interrupted import can be run again.
+    ``progress(report)`` is called after every batch and
+    ``on_reject(line, error, text)`` for every invalid line.
+    """
+    report = ImportReport()
+    batch = []
+    # Ids in the current batch; earlier batches are already in storage
+    seen = set()
+
+    def flush():
+        existing = storage.existing_ids([item["id"] for _, item in batch]) if batch else set()
+        for kind in CONTENT_KINDS:
+            items = [item for k, item in batch if k == kind and item["id"] not in existing]
+            if items:
+                storage.import_content(kind, items)
+                report.imported += len(items)
+        report.skipped += sum(1 for _, item in batch if item["id"] in existing)
+        batch.clear()
+        seen.clear()
+        if progress is not None:
+            progress(report)
+
+    for number, line in enumerate(lines, 1):
+        report.lines = number
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind, item = validate(record)
+            if not item.get("id"):
+                item["id"] = record_id(record)
+            if item["id"] in seen:
+                raise ValueError(f"duplicate id {item['id']}")
+            seen.add(item["id"])
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too
+            report.rejected += 1
+            if len(report.rejects) < REJECT_SAMPLES:
+                report.rejects.append((number, str(e)))
+            if on_reject is not None:
+                on_reject(number, str(e), line.rstrip("\n"))
+            continue
+        batch.append((kind, item))
+        if len(batch) >= batch_size:
+            flush()
+    if batch or progress is not None:
+        flush()
+    return report
+
+
+def export_ndjson(storage, kinds=CONTENT_KINDS):
+    """Yield one NDJSON line per stored recipe and story.
+
+    Comment threads are not part of the archive, so neither is their count.
+    """
+    for kind in kinds:
+        for item in storage.iter_content(kind):
+            record = {"kind": kind}
+            record.update((key, value) for key, value in item.items() if key != "comment_count")
+            yield json.dumps(record, ensure_ascii=False) + "\n"
@@ -0,0 +1,142 @@
+"""Newest-first feed over the combined recipe and story timeline.
+
+The timeline is a pandas frame with one row per recipe or story, kept
+sorted by ``(date, id)``. Dates are parsed once into ``datetime64`` and
+hearts live in an integer column, so paging from a cursor, tag
+filtering and top-N selection are vectorized instead of Python loops
+over every item.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .storage import CONTENT_KINDS
+
+PAGE_SIZE = 10
+DATE_FORMAT = "%Y-%m-%d"
+
+FeedItem = namedtuple("FeedItem", "type content date author id")
+FeedCursor = namedtuple("FeedCursor", "date id")
+
+KIND_DTYPE = pd.CategoricalDtype(CONTENT_KINDS)
+COLUMNS = ("id", "type", "date", "hearts", "author", "docno", "item")
+
+
+def _frame(rows):
+    frame = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    frame["date"] = pd.to_datetime(frame["date"], format=DATE_FORMAT)
+    return frame.astype({"type": KIND_DTYPE, "hearts": "int64", "docno": "int64"})
+
+
+def feed_item(kind, item):
+    return FeedItem(kind, item, pd.Timestamp(item["date_added"]),
+                    item.get("author", "Anonymous"), item["id"])
+
+
+def _row(kind, item, docno):
+    return (item["id"], kind, item["date_added"], item.get("hearts", 0),
+            item.get("author", "Anonymous"), docno, item)
+
+
+class Timeline:
+    """Immutable, ascending ``(date, id)`` ordered frame of feed items.
+
+    ``docno`` ties each row to its bit in the snapshot's ``TagIndex`` so
+    a tag filter can be applied as a boolean mask.
+    """
+
+    __slots__ = ("frame",)
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    @classmethod
+    def build(cls, content, docnos):
+        rows = [
+            _row(kind, item, docnos[item["id"]])
+            for kind, items in content.items()
+            for item in items
+        ]
+        return cls(_frame(rows).sort_values(["date", "id"], ignore_index=True))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _position(self, date, content_id):
+        # Binary search on the date column, then on ids within that date.
+        dates = self.frame["date"].to_numpy()
+        date = np.datetime64(pd.Timestamp(date), "ns")
+        lo = dates.searchsorted(date, "left")
+        hi = dates.searchsorted(date, "right")
+        return lo + self.frame["id"].to_numpy()[lo:hi].searchsorted(content_id)
+
+    def with_items(self, entries):
+        """Copy with ``entries``, ``(kind, item, docno)`` tuples, added."""
+        rows = _frame([_row(*entry) for entry in entries])
+        if len(rows) > 1:
+            rows = rows.sort_values(["date", "id"], ignore_index=True)
+        # Merge by binary-searching each new row's place instead of re-sorting
+        dates = self.frame["date"].to_numpy()
+        ids = self.frame["id"].to_numpy()
+        new_dates = rows["date"].to_numpy()
+        positions = [
+            lo + ids[lo:hi].searchsorted(content_id)
+            for lo, hi, content_id in zip(
+                dates.searchsorted(new_dates, "left"), dates.searchsorted(new_dates, "right"),
+                rows["id"].to_numpy(),
+            )
+        ]
+        order = np.insert(
+            np.arange(len(self.frame)), positions, np.arange(len(rows)) + len(self.frame)
+        )
+        frame = pd.concat([self.frame, rows], ignore_index=True)
+        return Timeline(frame.take(order).reset_index(drop=True))
+
+    def with_replaced(self, items):
+        """Copy with the rows of ``items`` (same id and date) swapped in."""
+        positions = [self._position(pd.Timestamp(item["date_added"]), item["id"]) for item in items]
+        frame = self.frame.copy(deep=False)
+        hearts = frame["hearts"].to_numpy().copy()
+        column = frame["item"].to_numpy().copy()
+        for pos, item in zip(positions, items):
+            hearts[pos] = item.get("hearts", 0)
+            column[pos] = item
+        frame["hearts"] = hearts
+        frame["item"] = column
+        return Timeline(frame)
+
+    def _items(self, rows):
+        frame = self.frame
+        columns = [frame[column].to_numpy() for column in ("type", "item", "date", "author", "id")]
+        return [
+            FeedItem(kind, item, pd.Timestamp(date), author, content_id)
+            for kind, item, date, author, content_id in zip(*(c[rows] for c in columns))
+        ]
+
+    def _selected(self, end, mask):
+        if mask is None:
+            return np.arange(end)
+        return np.flatnonzero(mask[self.frame["docno"].to_numpy()[:end]])
+
+    def page(self, cursor=None, limit=PAGE_SIZE, mask=None):
+        """Return up to ``limit`` items older than ``cursor``, newest first.
+
+        ``mask`` is an optional boolean array indexed by docno. The second
+        value is the cursor for the following page, or None when no more
+        items match.
+        """
+        end = len(self.frame) if cursor is None else self._position(*cursor)
+        selected = self._selected(end, mask)
+        rows = selected[::-1][:limit]
+        page = self._items(rows)
+        next_cursor = None
+        if len(selected) > limit:
+            next_cursor = FeedCursor(page[-1].date, page[-1].id)
+        return page, next_cursor
+
+    def top(self, limit=PAGE_SIZE, mask=None, by="hearts"):
+        """The ``limit`` items with the highest ``by`` value, ties newest first."""
+        selected = self._selected(len(self.frame), mask)[::-1]
+        ranked = self.frame[by].iloc[selected].nlargest(limit, keep="first")
+        return self._items(ranked.index.to_numpy())
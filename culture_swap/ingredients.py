@@ -0,0 +1,225 @@
+"""Canonical ingredient terms, autocomplete and "cook with what I have".
+
+Recipe ingredients are free-text lines (``"2 cups basmati rice, rinsed"``).
+``normalize`` reduces a line to a canonical term: it drops quantities,
+units, notes in parentheses, preparation words and trailing remarks, and
+turns the last word singular (``"basmati rice"``, ``"3 tomatoes"`` ->
+``"tomato"``).
+
+``IngredientIndex`` keeps a sorted term list for prefix autocomplete and
+a posting list per term. Posting lists hold the document numbers of the
+snapshot's ``TagIndex``, so a tag filter mask applies to them directly.
+Overlap ranking counts matches per recipe with ``numpy.bincount`` over the
+posting lists of the chosen terms. The cost depends on those lists, not
+on a scan of every recipe.
+"""
+import bisect
+import re
+import threading
+from array import array
+from functools import lru_cache
+
+from .storage import RECIPE
+
+MAX_PREFIX_TERMS = 200
+SUGGESTIONS = 8
+# Ingredient lines repeat a lot across recipes ("1 onion, chopped")
+NORMALIZE_CACHE_SIZE = 1 << 16
+
+FRACTIONS = "½⅓⅔¼¾⅕⅖⅗⅘⅙⅚⅛⅜⅝⅞"
+UNITS = frozenset("""
+    cup cups c tbsp tbsps tbs tablespoon tablespoons tsp tsps teaspoon teaspoons
+    g gr gram grams kg kilogram kilograms mg ml milliliter milliliters millilitre millilitres
+    l liter liters litre litres dl cl oz ounce ounces lb lbs pound pounds qt quart quarts
+    pt pint pints gal gallon gallons stick sticks
+    pinch pinches dash dashes handful handfuls bunch bunches sprig sprigs clove cloves
+    can cans tin tins jar jars packet packets package packages pack bag bags box bottle
+    slice slices piece pieces head heads stalk stalks knob drop drops splash cube cubes
+    sheet sheets fillet fillets
+""".split())
+FILLER = frozenset("a an of some few about approx approximately around x heaped heaping level scant".split())
+PREPARATION = frozenset("""
+    chopped diced minced sliced grated shredded crushed peeled cubed halved quartered
+    rinsed drained softened melted beaten sifted toasted roasted cooked uncooked boiled
+    fresh freshly frozen dried finely roughly coarsely thinly thickly large small medium
+    big extra ripe whole optional
+""".split())
+TRAILING = re.compile(r"\b(to taste|for (?:garnish|serving|frying|the \w+)|as needed|or more|or to taste)\b.*$")
+PARENTHESES = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+TOKEN_RE = re.compile(rf"[a-zà-ÿ][a-zà-ÿ'-]*|[\d{FRACTIONS}][\d{FRACTIONS}./,-]*[a-z]*")
+QUANTITY_RE = re.compile(rf"[\d{FRACTIONS}][\d{FRACTIONS}./,-]*([a-z]*)")
+
+# Plurals the suffix rules below would get wrong
+IRREGULAR = {
+    "leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife",
+    "chilies": "chili", "chillies": "chilli", "cookies": "cookie", "brownies": "brownie",
+    "smoothies": "smoothie", "calories": "calorie", "sardines": "sardine",
+}
+INVARIANT = frozenset("molasses grits swiss hummus couscous asparagus citrus series".split())
+
+
+def singular(word):
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    if word in INVARIANT or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _is_quantity(token):
+    match = QUANTITY_RE.fullmatch(token)
+    return match is not None and (not match.group(1) or match.group(1) in UNITS)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize(line):
+    """Canonical ingredient term for one line, or None if nothing is left."""
+    text = PARENTHESES.sub(" ", line.lower()).split(",", 1)[0]
+    text = TRAILING.sub("", text)
+    tokens = TOKEN_RE.findall(text)
+    # Leading quantities, units and filler: "1 1/2 cups of", "400g", "a pinch of"
+    start = 0
+    while start < len(tokens) and (
+        _is_quantity(tokens[start]) or tokens[start] in UNITS or tokens[start] in FILLER
+    ):
+        start += 1
+    words = [
+        token for token in tokens[start:]
+        if token not in PREPARATION and not _is_quantity(token)
+    ]
+    if not words:
+        return None
+    words[-1] = singular(words[-1])
+    return " ".join(words)
+
+
+def recipe_terms(item):
+    """Distinct canonical terms of a recipe's ingredient lines, in order."""
+    terms = (normalize(line) for line in item.get("ingredients") or ())
+    return tuple(dict.fromkeys(term for term in terms if term))
+
+
+def parse_pantry(text):
+    """Canonical terms from a comma or newline separated list."""
+    terms = (normalize(part) for part in re.split(r"[,\n;]", text))
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+class _Postings:
+    """State shared by every copy of an index; it only ever grows.
+
+    Copies only look at document numbers below their own ``size``, so a
+    snapshot never sees recipes added after it. The lock guards the
+    arrays while they grow.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.terms = []
+        self.doc_terms = {}
+        self.totals = array("i")
+        self.ids = []
+
+
+class IngredientIndex:
+    """Immutable view of the ingredient index; ``with_items`` returns an updated copy."""
+
+    __slots__ = ("_shared", "size")
+
+    def __init__(self, shared=None, size=0):
+        self._shared = _Postings() if shared is None else shared
+        self.size = size
+
+    @classmethod
+    def build(cls, content, docnos):
+        index = cls()
+        shared = index._shared
+        with shared.lock:
+            for kind, items in content.items():
+                for item in items:
+                    index._add(kind, item, docnos[item["id"]])
+        return index
+
+    # Callers hold the shared lock
+    def _add(self, kind, item, docno):
+        shared = self._shared
+        if docno >= len(shared.totals):
+            shared.totals.extend([0] * (docno + 1 - len(shared.totals)))
+            shared.ids.extend([None] * (docno + 1 - len(shared.ids)))
+        if shared.ids[docno] is None:
+            shared.ids[docno] = item["id"]
+            terms = recipe_terms(item) if kind == RECIPE else ()
+            shared.doc_terms[docno] = terms
+            shared.totals[docno] = len(terms)
+            for term in terms:
+                postings = shared.postings.get(term)
+                if postings is None:
+                    postings = shared.postings[term] = array("i")
+                    bisect.insort(shared.terms, term)
+                postings.append(docno)
+        self.size = max(self.size, docno + 1)
+
+    def with_items(self, entries):
+        """Copy with ``entries``, ``(kind, item, docno)`` tuples, added."""
+        index = IngredientIndex(self._shared, self.size)
+        with self._shared.lock:
+            for kind, item, docno in entries:
+                index._add(kind, item, docno)
+        return index
+
+    def terms_of(self, docno):
+        """Canonical terms of the recipe with document number ``docno``."""
+        return self._shared.doc_terms.get(docno, ())
+
+    def complete(self, prefix, limit=SUGGESTIONS):
+        """Known terms starting with ``prefix``, most used first."""
+        prefix = " ".join(TOKEN_RE.findall(prefix.lower()))
+        if not prefix:
+            return []
+        shared = self._shared
+        with shared.lock:
+            start = bisect.bisect_left(shared.terms, prefix)
+            matches = []
+            for term in shared.terms[start:start + MAX_PREFIX_TERMS]:
+                if not term.startswith(prefix):
+                    break
+                matches.append((-len(shared.postings[term]), term))
+        return [term for _, term in sorted(matches)[:limit]]
+
+    def cook_with(self, terms, limit=10, mask=None):
+        """Recipes sharing the most ingredients with ``terms``.
+
+        Returns ``[(content_id, matched, total), ...]``. Recipes that need
+        the fewest other ingredients come first, then those using more of
+        ``terms``, then the newest. ``mask`` is an optional boolean array
+        indexed by docno, e.g. from ``TagIndex.to_array``.
+        """
+        import numpy as np
+
+        shared = self._shared
+        with shared.lock:
+            lists = [np.array(shared.postings[term], np.int64) for term in terms if term in shared.postings]
+            totals = np.array(shared.totals[:self.size], np.int64)
+        if not lists:
+            return []
+        docs = np.concatenate(lists)
+        matched = np.bincount(docs[docs < self.size], minlength=self.size)
+        if mask is not None:
+            covered = min(len(mask), self.size)
+            matched[:covered] *= mask[:covered]
+        candidates = np.flatnonzero(matched)
+        missing = totals[candidates] - matched[candidates]
+        order = np.lexsort((-candidates, -matched[candidates], missing))[:limit]
+        return [
+            (shared.ids[docno], int(matched[docno]), int(totals[docno]))
+            for docno in candidates[order]
+        ]
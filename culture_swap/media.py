@@ -0,0 +1,278 @@
+"""Content-addressed store for uploaded photos and videos.
+
+Uploads are streamed to disk in chunks while being hashed and stored as
+``<root>/<hash[:2]>/<hash><ext>``, so identical files are kept once and
+same-named uploads no longer overwrite each other. A post references a
+file by listing its path in ``media``; the number of such entries is
+the file's reference count, and files no post references are removed by
+the garbage collector.
+
+Videos are not pushed through the Streamlit websocket. They are
+hard-linked into Streamlit's static directory (no extra disk space), or
+served from ``CULTURE_SWAP_MEDIA_URL`` by a CDN or web server pointing at
+``data/media``. Browsers then fetch the file themselves with HTTP range
+requests, so they can stream and seek without the server holding the
+file in memory. A poster frame is cut with ``ffmpeg``, if it is
+installed, when a video is uploaded. Photos get smaller WebP variants
+(see ``variants``), served the same way.
+"""
+import hashlib
+import html
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote
+
+from . import metrics
+from .variants import WIDTHS, existing_variants, is_image, variant_path
+
+CHUNK_SIZE = 1024 * 1024
+GC_INTERVAL = 3600
+# Uploads are written before the post that references them is saved.
+GC_GRACE_PERIOD = 3600
+VIDEO_EXTENSIONS = (".mp4",)
+POSTER_SUFFIX = ".poster.jpg"
+POSTER_WIDTH = 640
+# Seconds into the video, past fade-ins and black first frames
+POSTER_OFFSET = 1.0
+FFMPEG_TIMEOUT = 60
+MEDIA_URL_ENV = "CULTURE_SWAP_MEDIA_URL"
+# Streamlit serves <app dir>/static/ at this path when server.enableStaticServing is on
+STATIC_URL = "app/static"
+STATIC_SUBDIR = "media"
+
+logger = logging.getLogger(__name__)
+
+
+def is_video(path):
+    return str(path).lower().endswith(VIDEO_EXTENSIONS)
+
+
+def poster_path(video_path):
+    return Path(video_path).with_suffix(POSTER_SUFFIX)
+
+
+def make_poster(video_path, width=POSTER_WIDTH):
+    """Write a JPEG frame of ``video_path`` next to it; returns its path or None.
+
+    Needs ``ffmpeg`` on the PATH. Videos shorter than ``POSTER_OFFSET``
+    use their first frame.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    target = poster_path(video_path)
+    fd, tmp_name = tempfile.mkstemp(suffix=".jpg", dir=target.parent)
+    os.close(fd)
+    try:
+        for offset in (POSTER_OFFSET, 0):
+            result = subprocess.run(
+                [ffmpeg, "-v", "error", "-y", "-ss", str(offset), "-i", str(video_path),
+                 "-frames:v", "1", "-vf", f"scale='min({width},iw)':-2", "-q:v", "5", tmp_name],
+                capture_output=True, timeout=FFMPEG_TIMEOUT,
+            )
+            if result.returncode == 0 and os.path.getsize(tmp_name):
+                metrics.count("bytes_written_total", os.path.getsize(tmp_name), source="media")
+                os.replace(tmp_name, target)
+                return target
+        logger.warning("No poster frame for %s: %s", video_path, result.stderr.decode(errors="replace").strip())
+    except (OSError, subprocess.TimeoutExpired):
+        logger.exception("Making a poster frame for %s failed", video_path)
+    finally:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+    return None
+
+
+class MediaStore:
+    def __init__(self, root, static_dir=None, variants=None):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        # A variants.VariantPipeline that makes smaller copies of photos, if any
+        self.variants = variants
+        # Where files are served from: an external base URL, or links in static_dir
+        self.url = os.environ.get(MEDIA_URL_ENV, "").rstrip("/") or None
+        self.public_dir = None
+        if self.url is None and static_dir is not None:
+            self.public_dir = Path(static_dir) / STATIC_SUBDIR
+            self.url = f"{STATIC_URL}/{STATIC_SUBDIR}"
+
+    def path_for(self, digest, suffix):
+        return self.root / digest[:2] / f"{digest}{suffix.lower()}"
+
+    def ingest(self, fileobj, filename):
+        """Stream ``fileobj`` into the store and return its path as a string."""
+        digest = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+                metrics.count("bytes_written_total", out.tell(), source="media")
+            path = self.path_for(digest.hexdigest(), Path(filename).suffix)
+            if path.exists():
+                os.unlink(tmp_name)
+                # Restart the grace period so a pending GC pass keeps the file
+                os.utime(path)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        if is_video(path) and not poster_path(path).exists():
+            make_poster(path)
+        if is_image(path) and self.variants is not None:
+            self.variants.submit(path)
+        return str(path)
+
+    def _relative(self, path):
+        try:
+            return Path(os.path.normpath(path)).relative_to(os.path.normpath(self.root))
+        except ValueError:
+            return None
+
+    def _publish(self, relative):
+        # Tornado refuses symlinks out of the static directory, so link the inode
+        public = self.public_dir / relative
+        if public.exists():
+            return True
+        try:
+            public.parent.mkdir(parents=True, exist_ok=True)
+            os.link(self.root / relative, public)
+        except FileExistsError:
+            pass
+        except OSError:
+            logger.warning("Could not link %s into %s; it goes through the websocket",
+                           relative, self.public_dir, exc_info=True)
+            return False
+        return True
+
+    def url_for(self, path):
+        """URL of a stored file, or None if it is not served outside the websocket."""
+        relative = self._relative(path) if self.url else None
+        if relative is None:
+            return None
+        if self.public_dir is not None and not self._publish(relative):
+            return None
+        return f"{self.url}/{quote(relative.as_posix())}"
+
+    def video_html(self, path):
+        """A ``<video>`` tag that fetches nothing until played, or None if not served.
+
+        Without a poster the browser reads just enough to draw the first frame.
+        """
+        url = self.url_for(path)
+        if url is None:
+            return None
+        poster = poster_path(path)
+        poster_url = self.url_for(poster) if poster.exists() else None
+        attributes = f'src="{html.escape(url)}" controls playsinline style="width: 100%"'
+        if poster_url:
+            attributes += f' preload="none" poster="{html.escape(poster_url)}"'
+        else:
+            attributes += ' preload="metadata"'
+        return f"<video {attributes}></video>"
+
+    def image_for(self, path, width):
+        """The variant of an image to draw ``width`` pixels wide, or the original."""
+        variant = None if self.variants is None else self.variants.variant(path, width)
+        return str(variant or path)
+
+    def image_html(self, path, width):
+        """A lazy ``<img>`` letting the browser choose among the variants, or None.
+
+        The image links to the original, which is only fetched when opened;
+        until the variants are made, the original is the image. None means
+        the store is not served.
+        """
+        original_url = self.url_for(path)
+        if original_url is None:
+            return None
+        original_url = html.escape(original_url)
+        variant = None if self.variants is None else self.variants.variant(path, width)
+        if variant is None:
+            return f'<img src="{original_url}" loading="lazy" decoding="async" style="width: 100%; height: auto">'
+        srcset = ", ".join(
+            f"{html.escape(self.url_for(variant_file))} {variant_width}w"
+            for variant_width, variant_file in sorted(existing_variants(path).items())
+        )
+        return (
+            f'<a href="{original_url}" target="_blank">'
+            f'<img src="{html.escape(self.url_for(variant))}" srcset="{srcset}" '
+            f'sizes="(max-width: 640px) 100vw, {width // 2}px" '
+            f'loading="lazy" decoding="async" style="width: 100%; height: auto"></a>'
+        )
+
+    def _stored_files(self):
+        for shard in self.root.iterdir():
+            if shard.is_dir() and len(shard.name) == 2:
+                yield from shard.iterdir()
+        yield from self.tmp_dir.iterdir()
+
+    def collect(self, referenced, grace_period=GC_GRACE_PERIOD):
+        """Delete stored files not in ``referenced`` and older than the grace period.
+
+        Only files written by this store are considered, so media saved
+        by name before it existed is never touched. Returns the removed paths.
+        """
+        referenced = {os.path.normpath(path) for path in referenced}
+        # Posters and variants live as long as the file they were made from
+        referenced |= {os.path.normpath(poster_path(path)) for path in referenced if is_video(path)}
+        referenced |= {
+            os.path.normpath(variant_path(path, width))
+            for path in referenced if is_image(path) for width in WIDTHS
+        }
+        cutoff = time.time() - grace_period
+        removed = []
+        for path in self._stored_files():
+            if os.path.normpath(path) in referenced:
+                continue
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed.append(str(path))
+            # The static link shares the file's disk space, so it goes too
+            relative = self._relative(path)
+            if self.public_dir is not None and relative is not None:
+                try:
+                    (self.public_dir / relative).unlink()
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+def media_refcounts(content):
+    """``Counter`` of media path -> number of posts referencing it."""
+    counts = Counter()
+    for items in content.values():
+        for item in items:
+            counts.update(os.path.normpath(path) for path in item.get("media", ()))
+    return counts
+
+
+def start_gc(store, referenced, interval=GC_INTERVAL):
+    """Run ``store.collect(referenced())`` every ``interval`` seconds in a daemon thread."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                store.collect(referenced())
+            except Exception:
+                logger.exception("Media garbage collection failed")
+
+    thread = threading.Thread(target=loop, name="media-gc", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,323 @@
+"""Per-rerun tracing, counters and latency histograms.
+
+Every script run (or fragment run) is a trace tagged with its page,
+session and scope; the phases inside it are timed with ``span``. Backend
+modules call ``count`` for bytes read and written and cache hits, which
+updates process-wide counters and the running trace. Finished traces are
+kept in a bounded ring for the debug panel and can be appended to a
+JSONL file; counters and histograms render in the Prometheus text
+format. Everything here is in-memory and lock-protected, so recording is
+cheap enough to leave on.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+PREFIX = "culture_swap"
+# Upper bounds in seconds, as Prometheus histograms expect
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_TRACES = 200
+EXPORT_INTERVAL = 15
+ADMINS_ENV = "CULTURE_SWAP_ADMINS"
+TRACES_FILENAME = "traces.jsonl"
+# One file per process, so replicas sharing the directory do not overwrite each other
+PROMETHEUS_FILENAME = "metrics-{instance}.prom"
+
+HELP = {
+    "reruns_total": "Script and fragment runs by page and scope.",
+    "items_rendered_total": "Feed cards rendered.",
+    "bytes_read_total": "Bytes read from storage, media and caches.",
+    "bytes_written_total": "Bytes written to storage, media and caches.",
+    "cache_requests_total": "Cache lookups by cache and result.",
+    "rerun_duration_seconds": "Wall time of a script or fragment run.",
+    "span_duration_seconds": "Wall time of one phase of a run.",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Trace:
+    """The spans and counts recorded during one run."""
+
+    def __init__(self, page, session, scope):
+        self.page = page
+        self.session = session
+        self.scope = scope
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self.counts = {}
+        self.duration = None
+
+    def to_dict(self):
+        return {
+            "ts": round(self.started, 3),
+            "page": self.page,
+            "session": self.session,
+            "scope": self.scope,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": self.spans,
+            "counts": self.counts,
+        }
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+# Metric name first so each family is contiguous; label values may mix types
+def _sort_key(entry):
+    (name, labels), _ = entry
+    return name, repr(labels)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """Counters, histograms and recent traces for one process."""
+
+    def __init__(self, recent=RECENT_TRACES):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {}
+        self.histograms = {}
+        self.recent = deque(maxlen=recent)
+        self._sinks = []
+
+    # Counters and histograms
+
+    def count(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        trace = self.current()
+        if trace is not None:
+            label = name if not labels else f"{name}{_format_labels(key[1])}"
+            trace.counts[label] = trace.counts.get(label, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    # Traces
+
+    def current(self):
+        return getattr(self._local, "trace", None)
+
+    def begin_rerun(self, page, session, scope="script"):
+        """Start the trace for a script run, closing any left open before it.
+
+        A run that ends early (``st.rerun``, an exception) never reaches
+        ``end_rerun``; its trace is finished when the thread starts the next.
+        """
+        if self.current() is not None:
+            self.end_rerun()
+        self._local.trace = Trace(page, session, scope)
+        return self._local.trace
+
+    def tag(self, **tags):
+        """Retag the running trace, e.g. once the page is known."""
+        trace = self.current()
+        if trace is not None:
+            for name, value in tags.items():
+                setattr(trace, name, value)
+
+    def end_rerun(self):
+        trace = self.current()
+        if trace is None:
+            return None
+        self._local.trace = None
+        trace.duration = time.perf_counter() - trace._start
+        self.count("reruns_total", page=trace.page, scope=trace.scope)
+        self.observe("rerun_duration_seconds", trace.duration, page=trace.page, scope=trace.scope)
+        with self._lock:
+            self.recent.append(trace)
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink(trace)
+            except Exception:
+                logger.exception("Exporting a trace failed")
+        return trace
+
+    @contextmanager
+    def span(self, name):
+        """Time one phase of the running trace."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("span_duration_seconds", elapsed, span=name)
+            trace = self.current()
+            if trace is not None:
+                trace.spans.append({
+                    "name": name,
+                    "start_ms": round((start - trace._start) * 1000, 3),
+                    "ms": round(elapsed * 1000, 3),
+                })
+
+    @contextmanager
+    def fragment(self, name, page, session):
+        """A span inside a full run, or a trace of its own in a fragment run."""
+        if self.current() is not None:
+            with self.span(name):
+                yield
+            return
+        self.begin_rerun(page, session, scope=name)
+        try:
+            yield
+        finally:
+            self.end_rerun()
+
+    def traces(self, session=None):
+        with self._lock:
+            return [trace for trace in self.recent if session is None or trace.session == session]
+
+    # Export
+
+    def add_sink(self, sink):
+        """Call ``sink(trace)`` for every finished trace."""
+        with self._lock:
+            self._sinks.append(sink)
+
+    def prometheus(self, instance=None):
+        """All counters and histograms in the Prometheus text format.
+
+        ``instance``, if given, is added as a label to every sample.
+        """
+        base = (("instance", instance),) if instance else ()
+        with self._lock:
+            counters = sorted(self.counters.items(), key=_sort_key)
+            histograms = sorted(
+                ((key, (list(h.counts), h.total, h.count)) for key, h in self.histograms.items()),
+                key=_sort_key,
+            )
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {PREFIX}_{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{PREFIX}_{name}{_format_labels(base + labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            labels = base + labels
+            for bound, bucket in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{PREFIX}_{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def jsonl(self, session=None):
+        return "".join(json.dumps(trace.to_dict()) + "\n" for trace in self.traces(session))
+
+
+class FileExporter:
+    """Appends traces to ``traces.jsonl`` and rewrites this process's metrics file periodically.
+
+    The metrics file is ``metrics-<host>-<pid>.prom`` and every sample in
+    it carries that ``instance`` label. It is replaced atomically so a node
+    exporter textfile collector (or anything else that scrapes the
+    directory) never sees half of it.
+    """
+
+    def __init__(self, metrics, directory, interval=EXPORT_INTERVAL):
+        self.metrics = metrics
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.instance = f"{socket.gethostname()}-{os.getpid()}"
+        self.prometheus_path = self.directory / PROMETHEUS_FILENAME.format(instance=self.instance)
+        self._lock = threading.Lock()
+        self._traces = open(self.directory / TRACES_FILENAME, "a", buffering=1)
+        metrics.add_sink(self.write_trace)
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+        self._thread.start()
+        atexit.register(self.write_prometheus)
+
+    def write_trace(self, trace):
+        line = json.dumps(trace.to_dict()) + "\n"
+        with self._lock:
+            self._traces.write(line)
+
+    def write_prometheus(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.metrics.prometheus(self.instance))
+            os.replace(tmp_path, self.prometheus_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write_prometheus()
+            except OSError:
+                logger.exception("Writing %s failed", self.prometheus_path)
+
+
+METRICS = Metrics()
+count = METRICS.count
+span = METRICS.span
+
+
+def start_export(directory=None, interval=EXPORT_INTERVAL):
+    """Export to ``directory`` (default ``CULTURE_SWAP_METRICS_DIR``); None if unset."""
+    directory = directory or os.environ.get("CULTURE_SWAP_METRICS_DIR")
+    if not directory:
+        return None
+    return FileExporter(METRICS, directory, interval)
+
+
+def is_admin(username):
+    """Whether ``username`` is listed in ``CULTURE_SWAP_ADMINS`` (comma separated)."""
+    admins = os.environ.get(ADMINS_ENV, "")
+    return username in {name.strip() for name in admins.split(",") if name.strip()}
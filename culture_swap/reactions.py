@@ -0,0 +1,87 @@
+"""Write-behind counter for ❤️ reactions.
+
+Clicks are added to an in-memory tally under a lock and flushed to
+storage as one batch, either every ``flush_interval`` seconds or as soon
+as ``flush_size`` clicks are waiting. Storage applies each batch as
+``hearts = hearts + n`` so concurrent sessions and processes never lose
+increments, and every session in the process sees unflushed clicks
+through ``count``.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+FLUSH_INTERVAL = 2.0
+FLUSH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+class ReactionCounter:
+    """Coalesces heart clicks and writes them through ``snapshots`` in batches."""
+
+    def __init__(self, snapshots, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        self.snapshots = snapshots
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._pending_total = 0
+        # Clicks taken out of _pending by a flush that has not finished yet
+        self._flushing = Counter()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="reaction-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def allow(self, content_id, user):
+        """Hook for per-user deduplication; every click counts for now."""
+        return True
+
+    def add(self, content_id, user=None, count=1):
+        """Record ``count`` hearts for ``content_id``; returns False if rejected."""
+        if not self.allow(content_id, user):
+            return False
+        with self._lock:
+            self._pending[content_id] += count
+            self._pending_total += count
+            full = self._pending_total >= self.flush_size
+        if full:
+            self._wakeup.set()
+        return True
+
+    def unflushed(self, content_id):
+        with self._lock:
+            return self._pending[content_id] + self._flushing[content_id]
+
+    def count(self, item):
+        """Hearts for a snapshot item including clicks not yet in storage."""
+        return item.get("hearts", 0) + self.unflushed(item["id"])
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return {}
+                batch, self._pending = self._pending, Counter()
+                self._pending_total = 0
+                self._flushing = batch
+            try:
+                return self.snapshots.add_hearts(dict(batch))
+            except Exception:
+                logger.exception("Flushing %d reactions failed", sum(batch.values()))
+                with self._lock:
+                    self._pending.update(batch)
+                    self._pending_total += sum(batch.values())
+                return {}
+            finally:
+                with self._lock:
+                    self._flushing = Counter()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
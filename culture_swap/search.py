@@ -0,0 +1,184 @@
+"""Full-text search over recipe and story text.
+
+An in-process inverted index from terms to per-document term
+frequencies, ranked with BM25. The last word of a query is matched as a
+prefix so results update while typing. The index is updated as content
+is added and pickled to disk in the background, so a restart only has to
+index posts it has not seen yet.
+"""
+import atexit
+import bisect
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+from collections import Counter
+
+from . import metrics
+
+# Field -> weight; a title match counts as three body matches.
+FIELDS = {"title": 3, "description": 1, "ingredients": 1, "instructions": 1, "story": 1}
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from in into is it of on or our the this to with".split()
+)
+MAX_PREFIX_TERMS = 50
+SAVE_DELAY = 30
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def document_terms(item):
+    terms = Counter()
+    for field, weight in FIELDS.items():
+        value = item.get(field)
+        if not value:
+            continue
+        text = " ".join(value) if isinstance(value, (list, tuple)) else value
+        for token in tokenize(text):
+            terms[token] += weight
+    return terms
+
+
+class SearchIndex:
+    """BM25 inverted index keyed by content id."""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.terms = []
+        self._lock = threading.Lock()
+        self._save_timer = None
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __contains__(self, content_id):
+        return content_id in self.doc_lengths
+
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in ("postings", "doc_lengths", "total_length", "terms")}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    def add(self, item):
+        """Index one recipe or story; items already indexed are skipped."""
+        with self._lock:
+            if item["id"] in self.doc_lengths:
+                return False
+            terms = document_terms(item)
+            for term, frequency in terms.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = {}
+                    bisect.insort(self.terms, term)
+                postings[item["id"]] = frequency
+            length = sum(terms.values())
+            self.doc_lengths[item["id"]] = length
+            self.total_length += length
+            return True
+
+    def sync(self, content):
+        """Index anything in ``content`` that is missing; cheap when up to date."""
+        total = sum(len(items) for items in content.values())
+        if total == len(self.doc_lengths):
+            return 0
+        added = 0
+        for items in content.values():
+            for item in items:
+                added += self.add(item)
+        return added
+
+    def _expand(self, token):
+        start = bisect.bisect_left(self.terms, token)
+        matches = []
+        for term in self.terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query, limit=None):
+        """Return ``[(content_id, score), ...]`` best first.
+
+        Documents matching any query term are ranked; the final word is
+        expanded to every indexed term it is a prefix of unless the query
+        ends with a space.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        prefix_last = not query[-1:].isspace()
+        with self._lock:
+            count = len(self.doc_lengths)
+            if not count:
+                return []
+            avg_length = self.total_length / count
+            scores = Counter()
+            for position, token in enumerate(tokens):
+                if prefix_last and position == len(tokens) - 1:
+                    terms = self._expand(token)
+                else:
+                    terms = [token] if token in self.postings else []
+                for term in terms:
+                    postings = self.postings[term]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for content_id, frequency in postings.items():
+                        norm = 1 - self.b + self.b * self.doc_lengths[content_id] / avg_length
+                        scores[content_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+        return scores.most_common(limit)
+
+    def save(self, path):
+        path = str(path)
+        with self._lock:
+            data = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        # Processes sharing data/ save too, so each writes its own temporary file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        metrics.count("bytes_written_total", len(data), source="search_index")
+
+    def save_later(self, path, delay=SAVE_DELAY):
+        """Save after ``delay`` seconds, batching the adds made in between."""
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(delay, self._timed_save, (path,))
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _timed_save(self, path):
+        with self._lock:
+            self._save_timer = None
+        self.save(path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index, or start an empty one if there is none."""
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+                metrics.count("bytes_read_total", f.tell(), source="search_index")
+        except Exception:
+            # Missing, truncated, or written by an incompatible version
+            index = None
+        if not isinstance(index, cls):
+            index = cls()
+        atexit.register(index.save, path)
+        return index
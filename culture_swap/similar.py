@@ -0,0 +1,218 @@
+"""Approximate "more like this" lookups with MinHash and LSH banding.
+
+A post's features are its canonical ingredient terms (see
+``ingredients.recipe_terms``) plus its culture, meal type and dietary
+tags. A MinHash signature of ``NUM_HASHES`` values estimates the Jaccard
+similarity of two feature sets as the share of positions where the two
+signatures agree. The signature is cut into ``BANDS`` bands of
+``ROWS`` values each, and every band is a key into a bucket table. Two
+posts become candidates when any band matches. With 16 bands of 4 rows,
+that is likely above about 50% similarity and rare below 25%.
+
+A lookup reads the post's buckets and scores only those candidates. It
+never compares against the whole corpus. Very common buckets, such as
+stories that share one culture tag, only add their newest
+``MAX_BUCKET_CANDIDATES`` entries.
+
+Like ``IngredientIndex``, this index keys everything by ``TagIndex``
+docno and shares append-only state between snapshot copies.
+"""
+import threading
+import zlib
+from array import array
+from functools import lru_cache
+
+from .ingredients import recipe_terms
+from .storage import RECIPE
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+# Mersenne prime for the (a * x + b) mod p hash family; products fit in uint64
+PRIME = (1 << 31) - 1
+SEED = 20240101
+MAX_BUCKET_CANDIDATES = 200
+SIMILAR_LIMIT = 5
+# Features hashed per numpy pass while building
+BUILD_CHUNK = 1 << 15
+
+# field -> feature prefix, so "Vegan" the dietary tag and an ingredient
+# called "vegan" stay different features
+TAG_FIELDS = {"culture_tags": "c:", "meal_type": "m:", "dietary_tags": "d:"}
+
+
+def features(kind, item):
+    """Feature strings of a recipe or story."""
+    found = [f"i:{term}" for term in recipe_terms(item)] if kind == RECIPE else []
+    for field, prefix in TAG_FIELDS.items():
+        found.extend(prefix + value for value in item.get(field) or ())
+    return found
+
+
+@lru_cache(maxsize=1 << 16)
+def _hash_feature(feature):
+    return zlib.crc32(feature.encode()) % PRIME
+
+
+def _hash_features(found):
+    return [_hash_feature(feature) for feature in found]
+
+
+def _coefficients():
+    import numpy as np
+
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(1, PRIME, NUM_HASHES, dtype=np.uint64)
+    b = rng.integers(0, PRIME, NUM_HASHES, dtype=np.uint64)
+    # Odd multipliers folding a band's ROWS values into one 64-bit bucket key;
+    # a rare collision only adds a candidate that scores low
+    mix = rng.integers(1, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+    return a, b, mix
+
+
+class _Buckets:
+    """State shared by every copy of an index; it only ever grows."""
+
+    def __init__(self):
+        import numpy as np
+
+        self.lock = threading.Lock()
+        self.a, self.b, self.mix = _coefficients()
+        self.bands = [{} for _ in range(BANDS)]
+        # One row per docno, with spare capacity; rows without features are zero
+        self.signatures = np.zeros((0, NUM_HASHES), np.uint32)
+        self.ids = []
+
+    def reserve(self, size):
+        import numpy as np
+
+        if size > len(self.ids):
+            self.ids.extend([None] * (size - len(self.ids)))
+        if size > len(self.signatures):
+            grown = np.zeros((max(size, 2 * len(self.signatures)), NUM_HASHES), np.uint32)
+            grown[:len(self.signatures)] = self.signatures
+            self.signatures = grown
+
+
+class SimilarityIndex:
+    """Immutable view of the LSH index; ``with_items`` returns an updated copy."""
+
+    __slots__ = ("_shared", "size")
+
+    def __init__(self, shared=None, size=0):
+        self._shared = _Buckets() if shared is None else shared
+        self.size = size
+
+    @classmethod
+    def build(cls, content, docnos):
+        import numpy as np
+
+        index = cls()
+        entries = [
+            (docnos[item["id"]], item["id"], _hash_features(features(kind, item)))
+            for kind, items in content.items()
+            for item in items
+        ]
+        size = max((docno + 1 for docno, _, _ in entries), default=0)
+        entries = [entry for entry in entries if entry[2]]
+        shared = index._shared
+        with shared.lock:
+            shared.reserve(size)
+            # Signatures for many posts per pass: hash every feature, then take
+            # the minimum over each post's run of features
+            start = 0
+            while start < len(entries):
+                chunk, total = [], 0
+                while start < len(entries) and (not chunk or total + len(entries[start][2]) <= BUILD_CHUNK):
+                    chunk.append(entries[start])
+                    total += len(entries[start][2])
+                    start += 1
+                hashes = np.fromiter((h for _, _, found in chunk for h in found), np.uint64, total)
+                offsets = np.cumsum([0] + [len(found) for _, _, found in chunk[:-1]])
+                values = (np.outer(hashes, shared.a) + shared.b) % PRIME
+                signatures = np.minimum.reduceat(values, offsets, axis=0).astype(np.uint32)
+                shared.signatures[[docno for docno, _, _ in chunk]] = signatures
+                for (docno, content_id, _), keys in zip(chunk, index._band_keys(signatures)):
+                    index._add(docno, content_id, keys)
+        index.size = max(index.size, size)
+        return index
+
+    def _band_keys(self, signatures):
+        """Bucket key of every band of every signature, as lists of int."""
+        import numpy as np
+
+        bands = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+        return (bands * self._shared.mix).sum(axis=2).tolist()
+
+    # Callers hold the shared lock and have stored the signature
+    def _add(self, docno, content_id, keys):
+        shared = self._shared
+        if shared.ids[docno] is None:
+            shared.ids[docno] = content_id
+            if keys is not None:
+                for buckets, key in zip(shared.bands, keys):
+                    bucket = buckets.get(key)
+                    if bucket is None:
+                        bucket = buckets[key] = array("i")
+                    bucket.append(docno)
+        self.size = max(self.size, docno + 1)
+
+    def signature(self, found):
+        """MinHash signature of a list of feature strings, or None if empty."""
+        import numpy as np
+
+        if not found:
+            return None
+        shared = self._shared
+        hashes = np.array(_hash_features(found), np.uint64)
+        return ((np.outer(hashes, shared.a) + shared.b) % PRIME).min(axis=0).astype(np.uint32)
+
+    def with_items(self, entries):
+        """Copy with ``entries``, ``(kind, item, docno)`` tuples, added."""
+        index = SimilarityIndex(self._shared, self.size)
+        added = []
+        for kind, item, docno in entries:
+            signature = self.signature(features(kind, item))
+            keys = None if signature is None else self._band_keys(signature[None])[0]
+            added.append((docno, item["id"], signature, keys))
+        shared = self._shared
+        with shared.lock:
+            shared.reserve(max((docno + 1 for docno, _, _, _ in added), default=0))
+            for docno, content_id, signature, keys in added:
+                if shared.ids[docno] is None and signature is not None:
+                    shared.signatures[docno] = signature
+                index._add(docno, content_id, keys)
+        return index
+
+    def similar(self, docno, limit=SIMILAR_LIMIT):
+        """Posts most like the one with ``docno``: ``[(content_id, similarity), ...]``.
+
+        ``similarity`` is the estimated Jaccard similarity of the two
+        feature sets; ties go to the newer post.
+        """
+        import numpy as np
+
+        shared = self._shared
+        with shared.lock:
+            if docno >= self.size or shared.ids[docno] is None:
+                return []
+            signature = shared.signatures[docno].copy()
+            if not signature.any():
+                return []
+            candidates = set()
+            for buckets, key in zip(shared.bands, self._band_keys(signature[None])[0]):
+                bucket = buckets.get(key, ())
+                # Newest entries that this copy of the index can see
+                end = len(bucket)
+                while end and bucket[end - 1] >= self.size:
+                    end -= 1
+                candidates.update(bucket[max(0, end - MAX_BUCKET_CANDIDATES):end])
+            candidates.discard(docno)
+            if not candidates:
+                return []
+            candidates = np.array(sorted(candidates), np.int64)
+            rows = shared.signatures[candidates]
+            ids = shared.ids
+        scores = (rows == signature).mean(axis=1)
+        order = np.lexsort((-candidates, -scores))[:limit]
+        return [(ids[candidates[i]], float(scores[i])) for i in order]
@@ -0,0 +1,325 @@
+"""Process-wide, immutable snapshot of all content and users.
+
+Every Streamlit session reads the same ``ContentSnapshot``. When the
+storage version changes, the changes recorded in the storage journal
+(including those written by other processes) are applied to derive the
+next snapshot copy-on-write; a full reload only happens when there is no
+journal or the process has fallen too far behind.
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from . import metrics
+from .ingredients import IngredientIndex
+from .similar import SimilarityIndex
+from .storage import CONTENT_KINDS, RECIPE, STORY
+from .tags import TagIndex
+from .trending import Trending
+
+# New posts are applied as one batch. At 100k posts, 5,000 of them took
+# about 0.6s with every index built, against about 5s to reload and rebuild
+# just the timeline and trending order; larger imports reload instead.
+MAX_INCREMENTAL_CONTENT = 5000
+
+
+def freeze(item):
+    """Read-only copy of a recipe, story or user record."""
+    return MappingProxyType({
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in item.items()
+    })
+
+
+def _timed_hearts(deltas, events, now=None):
+    """``(content_id, hearts, at)`` for ``deltas`` (content id -> new hearts).
+
+    Replaying the journal is harmless, so ``events`` may include hearts
+    already counted here; only each post's newest ``delta`` hearts are
+    new. Hearts no event accounts for count from ``now``.
+    """
+    remaining = {content_id: delta for content_id, delta in deltas.items() if delta > 0}
+    timed = []
+    for content_id, hearts, at in reversed(events):
+        left = remaining.get(content_id, 0)
+        if left > 0:
+            timed.append((content_id, min(left, hearts), at))
+            remaining[content_id] = left - min(left, hearts)
+    now = time.time() if now is None else now
+    timed.extend((content_id, left, now) for content_id, left in remaining.items() if left > 0)
+    return timed
+
+
+class ContentSnapshot:
+    """All recipes, stories and users at one storage version."""
+
+    __slots__ = ("version", "content", "users", "_positions", "_timeline", "_tag_index",
+                 "_ingredient_index", "_trending", "_similarity_index")
+
+    def __init__(self, version, content, users, positions=None, timeline=None,
+                 tag_index=None, ingredient_index=None, trending=None, similarity_index=None):
+        self.version = version
+        self.content = MappingProxyType(content)
+        self.users = users
+        if positions is None:
+            positions = {
+                item["id"]: (kind, index)
+                for kind, items in content.items()
+                for index, item in enumerate(items)
+            }
+        self._positions = positions
+        self._timeline = timeline
+        self._tag_index = tag_index
+        self._ingredient_index = ingredient_index
+        self._trending = trending
+        self._similarity_index = similarity_index
+
+    @classmethod
+    def load(cls, storage):
+        version = storage.version()
+        content = {
+            kind: tuple(freeze(item) for item in storage.list_content(kind))
+            for kind in CONTENT_KINDS
+        }
+        users = MappingProxyType({
+            username: freeze(record)
+            for username, record in storage.load_users().items()
+        })
+        return cls(version, content, users)
+
+    @property
+    def recipes(self):
+        return self.content[RECIPE]
+
+    @property
+    def stories(self):
+        return self.content[STORY]
+
+    @property
+    def timeline(self):
+        # Sorted once per snapshot; derived snapshots update it in place of a re-sort.
+        # The feed module pulls in pandas, so it is only imported once a page needs it.
+        if self._timeline is None:
+            from .feed import Timeline
+            self._timeline = Timeline.build(self.content, self.tag_index.docnos)
+        return self._timeline
+
+    @property
+    def tag_index(self):
+        if self._tag_index is None:
+            self._tag_index = TagIndex.build(self.content)
+        return self._tag_index
+
+    @property
+    def ingredient_index(self):
+        if self._ingredient_index is None:
+            self._ingredient_index = IngredientIndex.build(self.content, self.tag_index.docnos)
+        return self._ingredient_index
+
+    @property
+    def trending(self):
+        if self._trending is None:
+            self._trending = Trending.build(self.content)
+        return self._trending
+
+    @property
+    def similarity_index(self):
+        if self._similarity_index is None:
+            self._similarity_index = SimilarityIndex.build(self.content, self.tag_index.docnos)
+        return self._similarity_index
+
+    def __contains__(self, content_id):
+        return content_id in self._positions
+
+    def get(self, content_id):
+        kind, index = self._positions[content_id]
+        return self.content[kind][index]
+
+    def feed_item(self, content_id):
+        from .feed import feed_item
+        kind, index = self._positions[content_id]
+        return feed_item(kind, self.content[kind][index])
+
+    def with_content(self, version, kind, item):
+        return self.with_contents(version, [(kind, item)])
+
+    def with_contents(self, version, added):
+        """Copy with ``added``, a list of ``(kind, item)``, appended in order.
+
+        Each collection, the positions and every derived index are copied
+        once for the whole batch.
+        """
+        new = {kind: [] for kind in CONTENT_KINDS}
+        frozen = []
+        for kind, item in added:
+            frozen.append((kind, freeze(item)))
+            new[kind].append(frozen[-1][1])
+        content = dict(self.content)
+        positions = dict(self._positions)
+        for kind, items in new.items():
+            if items:
+                start = len(content[kind])
+                content[kind] = content[kind] + tuple(items)
+                for index, item in enumerate(items, start):
+                    positions[item["id"]] = (kind, index)
+        tag_index = self.tag_index.with_items([item for _, item in frozen])
+        entries = [(kind, item, tag_index.docnos[item["id"]]) for kind, item in frozen]
+        timeline = None if self._timeline is None else self._timeline.with_items(entries)
+        ingredient_index = None
+        if self._ingredient_index is not None:
+            ingredient_index = self._ingredient_index.with_items(entries)
+        trending = None
+        if self._trending is not None:
+            trending = self._trending.with_items([item for _, item in frozen])
+        similarity_index = None
+        if self._similarity_index is not None:
+            similarity_index = self._similarity_index.with_items(entries)
+        return ContentSnapshot(
+            version, content, self.users, positions, timeline, tag_index, ingredient_index,
+            trending, similarity_index,
+        )
+
+    def with_hearts(self, version, totals, events=()):
+        """Copy with new heart ``totals``; ``events`` as in ``Changes.heart_events``."""
+        trending = self._trending
+        if trending is not None:
+            trending = trending.with_heart_events(_timed_hearts({
+                content_id: total - self.get(content_id).get("hearts", 0)
+                for content_id, total in totals.items()
+            }, events))
+        return self._with_counts(version, "hearts", totals, trending)
+
+    def with_comment_counts(self, version, totals):
+        return self._with_counts(version, "comment_count", totals, self._trending)
+
+    def _with_counts(self, version, field, totals, trending):
+        content = {kind: list(items) for kind, items in self.content.items()}
+        updated = []
+        for content_id, total in totals.items():
+            kind, index = self._positions[content_id]
+            content[kind][index] = MappingProxyType(dict(content[kind][index], **{field: total}))
+            updated.append(content[kind][index])
+        content = {kind: tuple(items) for kind, items in content.items()}
+        timeline = None if self._timeline is None else self._timeline.with_replaced(updated)
+        return ContentSnapshot(
+            version, content, self.users, self._positions, timeline, self._tag_index,
+            self._ingredient_index, trending, self._similarity_index,
+        )
+
+    def with_user(self, version, username, record):
+        users = dict(self.users)
+        users[username] = freeze(record)
+        return ContentSnapshot(
+            version, dict(self.content), MappingProxyType(users), self._positions,
+            self._timeline, self._tag_index, self._ingredient_index, self._trending,
+            self._similarity_index,
+        )
+
+    def with_changes(self, changes):
+        """Apply a ``storage.Changes`` journal read; replaying is harmless."""
+        snapshot = self
+        added, seen = [], set()
+        for kind, item in changes.content:
+            if item["id"] not in self and item["id"] not in seen:
+                seen.add(item["id"])
+                added.append((kind, item))
+        if added:
+            snapshot = snapshot.with_contents(changes.version, added)
+        hearts = {
+            content_id: total for content_id, total in changes.hearts.items()
+            if content_id in snapshot and snapshot.get(content_id)["hearts"] != total
+        }
+        if hearts:
+            snapshot = snapshot.with_hearts(changes.version, hearts, changes.heart_events)
+        comments = {
+            content_id: total for content_id, total in changes.comments.items()
+            if content_id in snapshot and snapshot.get(content_id).get("comment_count") != total
+        }
+        if comments:
+            snapshot = snapshot.with_comment_counts(changes.version, comments)
+        for username, record in changes.users.items():
+            snapshot = snapshot.with_user(changes.version, username, record)
+        if snapshot is self:
+            snapshot = ContentSnapshot(
+                changes.version, dict(self.content), self.users, self._positions,
+                self._timeline, self._tag_index, self._ingredient_index, self._trending,
+                self._similarity_index,
+            )
+        snapshot.version = changes.version
+        return snapshot
+
+
+class SnapshotStore:
+    """Hands out the current snapshot and routes writes to storage."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.storage.version():
+            metrics.count("cache_requests_total", cache="snapshot", result="hit")
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            result = "hit"
+            if snapshot is None or snapshot.version != self.storage.version():
+                result = "catch_up"
+                if snapshot is None or not self._catch_up(snapshot):
+                    result = "reload"
+                    self._snapshot = ContentSnapshot.load(self.storage)
+            metrics.count("cache_requests_total", cache="snapshot", result=result)
+            return self._snapshot
+
+    # Caller holds the lock. Returns False when the journal cannot be used.
+    def _catch_up(self, snapshot):
+        changes = self.storage.changes_since(snapshot.version)
+        if changes is None or len(changes.content) > MAX_INCREMENTAL_CONTENT:
+            return False
+        self._snapshot = snapshot.with_changes(changes)
+        return True
+
+    # Apply a write, then pick it up (with anything other processes wrote)
+    # from the journal. Without a journal, derive the next snapshot if this
+    # was the only write; otherwise reload lazily.
+    def _write(self, apply, derive):
+        with self._lock:
+            before = self.storage.version()
+            result = apply()
+            snapshot = self._snapshot
+            if snapshot is not None and not self._catch_up(snapshot):
+                if snapshot.version == before:
+                    self._snapshot = derive(snapshot, self.storage.version(), result)
+                else:
+                    self._snapshot = None
+        return result
+
+    def add_content(self, kind, item):
+        return self._write(
+            lambda: self.storage.add_content(kind, item),
+            lambda snapshot, version, added: snapshot.with_content(version, kind, added),
+        )
+
+    def add_hearts(self, increments):
+        """Apply ``{content_id: count}`` and return the new totals."""
+        return self._write(
+            lambda: self.storage.add_hearts_batch(increments),
+            lambda snapshot, version, totals: snapshot.with_hearts(version, totals),
+        )
+
+    def add_comment(self, content_id, comment):
+        """Append to a post's thread and return the thread's new size."""
+        return self._write(
+            lambda: self.storage.add_comment(content_id, comment),
+            lambda snapshot, version, total: snapshot.with_comment_counts(version, {content_id: total}),
+        )
+
+    def add_user(self, username, record):
+        return self._write(
+            lambda: self.storage.add_user(username, record),
+            lambda snapshot, version, added: (
+                snapshot.with_user(version, username, record) if added else snapshot
+            ),
+        )
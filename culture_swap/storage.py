@@ -0,0 +1,652 @@
+"""Storage backends for recipes, stories and users.
+
+SQLite (in WAL mode) is the default backend: every post, heart and
+registration is a single-row write instead of a rewrite of the whole
+JSON file. Each write also appends to a ``changes`` journal in the same
+transaction, which lets every process sharing the database apply just
+the new changes instead of reloading. The original JSON layout is still
+available as a backend and is imported into SQLite once, the first time
+the database is opened.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+RECIPE = "recipe"
+STORY = "story"
+CONTENT_KINDS = (RECIPE, STORY)
+
+DB_FILENAME = "culture_swap.db"
+JSON_FILENAMES = {RECIPE: "recipes.json", STORY: "stories.json"}
+USERS_FILENAME = "users.json"
+LOCK_FILENAME = ".lock"
+
+# Journal entries kept for processes that fall behind; older ones are pruned
+# and a process further behind than this reloads everything.
+JOURNAL_RETENTION = 100_000
+SQLITE_MAX_PARAMS = 500
+# Rows fetched at a time when streaming content out
+ITER_BATCH_SIZE = 1000
+COMMENT_PAGE_SIZE = 20
+COMMENTS_DIRNAME = "comments"
+
+# Everything written after a given version: new content as (kind, item),
+# hearts and comment counts as {id: total} and users as {username: record}.
+# heart_events lists (id, hearts added, unix time written) oldest first.
+Changes = namedtuple("Changes", "version content hearts users comments heart_events",
+                     defaults=((),))
+
+
+def new_content_id():
+    return uuid.uuid4().hex
+
+
+def ensure_content_id(item):
+    """Give ``item`` a stable id if it does not have one yet."""
+    if not item.get("id"):
+        item["id"] = new_content_id()
+    return item
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    # msvcrt locks a byte range from the current position and gives up
+    # after about 10 seconds, so keep trying
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def legacy_content_id(kind, position, item):
+    """Stable id for the record at ``position`` of a legacy JSON file."""
+    canonical = json.dumps(item, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{kind}:{position}:{canonical}".encode()).hexdigest()[:32]
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock shared by every process using ``path``."""
+    with open(path, "a") as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+class Storage:
+    """Interface shared by all storage backends."""
+
+    def list_content(self, kind):
+        """Return every item of ``kind`` in insertion order."""
+        raise NotImplementedError
+
+    def iter_content(self, kind):
+        """Yield every item of ``kind`` in insertion order."""
+        return iter(self.list_content(kind))
+
+    def existing_ids(self, ids):
+        """Return the subset of ``ids`` that is already stored."""
+        ids = set(ids)
+        return {
+            item["id"] for kind in CONTENT_KINDS for item in self.list_content(kind)
+            if item.get("id") in ids
+        }
+
+    def add_content(self, kind, item):
+        """Insert one recipe or story and return it with its id set."""
+        raise NotImplementedError
+
+    def import_content(self, kind, items):
+        """Insert many items of ``kind`` in a single commit."""
+        for item in items:
+            self.add_content(kind, item)
+
+    def add_hearts(self, content_id, count=1):
+        """Add ``count`` hearts to one item and return its new total."""
+        totals = self.add_hearts_batch({content_id: count})
+        if content_id not in totals:
+            raise KeyError(content_id)
+        return totals[content_id]
+
+    def add_hearts_batch(self, increments):
+        """Apply ``{content_id: count}`` in one commit and return the new totals.
+
+        Ids that do not exist are left out of the result.
+        """
+        raise NotImplementedError
+
+    def load_users(self):
+        """Return a ``{username: record}`` dict of registered users."""
+        raise NotImplementedError
+
+    def add_user(self, username, record):
+        """Store a new user; return False if the username is taken."""
+        raise NotImplementedError
+
+    def add_comment(self, content_id, comment):
+        """Append ``comment`` to a post's thread and return the thread's new size.
+
+        Raises KeyError if there is no post ``content_id``.
+        """
+        raise NotImplementedError
+
+    def list_comments(self, content_id, after=0, limit=COMMENT_PAGE_SIZE):
+        """Up to ``limit`` ``(position, comment)`` pairs after ``after``, oldest first.
+
+        Pass the last position of one page as ``after`` to read the next.
+        """
+        raise NotImplementedError
+
+    def version(self):
+        """Opaque value that changes whenever the stored data changes."""
+        raise NotImplementedError
+
+    def changes_since(self, version):
+        """``Changes`` written after ``version``, or None if they are unknown.
+
+        Backends without a journal return None and callers reload instead.
+        """
+        return None
+
+    def get_meta(self, key, default=None):
+        return default
+
+    def set_meta(self, key, value):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """Row-level storage in a single SQLite database running in WAL mode."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS content (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            date_added TEXT NOT NULL,
+            hearts INTEGER NOT NULL DEFAULT 0,
+            comment_count INTEGER NOT NULL DEFAULT 0,
+            body TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS content_timeline ON content (date_added, id);
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            email TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            at REAL,
+            amount INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS comments (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_id TEXT NOT NULL,
+            author TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS comments_thread ON comments (content_id, seq);
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            # Databases created before comments existed lack the cached count
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(content)")]
+            if "comment_count" not in columns:
+                conn.execute(
+                    "ALTER TABLE content ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0"
+                )
+            # ... and journals from before trending lack when and how many hearts
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(changes)")]
+            for column, kind in (("at", "REAL"), ("amount", "INTEGER")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE changes ADD COLUMN {column} {kind}")
+
+    # Streamlit serves each session from its own thread, so every thread
+    # gets its own connection; WAL lets readers run next to the writer.
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Journal entries only name what changed; readers fetch the current row,
+    # so replaying an entry twice is harmless. ``amounts`` (ref -> count) is
+    # recorded for hearts so readers can tell when each one was given.
+    @staticmethod
+    def _log(conn, op, refs, amounts=None):
+        at = time.time()
+        cursor = conn.executemany(
+            "INSERT INTO changes (op, ref, at, amount) VALUES (?, ?, ?, ?)",
+            [(op, ref, at, amounts and amounts.get(ref)) for ref in refs],
+        )
+        seq = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+        if seq % 1000 < cursor.rowcount:
+            conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - JOURNAL_RETENTION,))
+
+    @staticmethod
+    def _row_to_item(body, hearts, comment_count):
+        item = json.loads(body)
+        item["hearts"] = hearts
+        item["comment_count"] = comment_count
+        return item
+
+    @staticmethod
+    def _item_to_row(kind, item):
+        body = {key: value for key, value in item.items() if key not in ("hearts", "comment_count")}
+        return (item["id"], kind, item["date_added"], item.get("hearts", 0),
+                json.dumps(body))
+
+    def list_content(self, kind):
+        rows = self._connect().execute(
+            "SELECT body, hearts, comment_count FROM content WHERE kind = ? ORDER BY seq", (kind,)
+        ).fetchall()
+        metrics.count("bytes_read_total", sum(len(row[0]) for row in rows), source="sqlite")
+        return [self._row_to_item(*row) for row in rows]
+
+    # A cursor read in batches, so exports run in constant memory
+    def iter_content(self, kind):
+        cursor = self._connect().execute(
+            "SELECT body, hearts, comment_count FROM content WHERE kind = ? ORDER BY seq", (kind,)
+        )
+        while True:
+            rows = cursor.fetchmany(ITER_BATCH_SIZE)
+            if not rows:
+                return
+            metrics.count("bytes_read_total", sum(len(row[0]) for row in rows), source="sqlite")
+            for row in rows:
+                yield self._row_to_item(*row)
+
+    def existing_ids(self, ids):
+        conn = self._connect()
+        found = set()
+        for chunk in self._chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            found.update(row[0] for row in conn.execute(
+                f"SELECT id FROM content WHERE id IN ({marks})", chunk
+            ))
+        return found
+
+    def add_content(self, kind, item):
+        self.import_content(kind, [item])
+        return item
+
+    def import_content(self, kind, items):
+        rows = [self._item_to_row(kind, ensure_content_id(item)) for item in items]
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO content (id, kind, date_added, hearts, body) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._log(conn, "content", [row[0] for row in rows])
+        metrics.count("bytes_written_total", sum(len(row[4]) for row in rows), source="sqlite")
+
+    def add_hearts_batch(self, increments):
+        totals = {}
+        with self._connect() as conn:
+            for content_id, count in increments.items():
+                row = conn.execute(
+                    "UPDATE content SET hearts = hearts + ? WHERE id = ? RETURNING hearts",
+                    (count, content_id),
+                ).fetchone()
+                if row is not None:
+                    totals[content_id] = row[0]
+            if totals:
+                self._log(conn, "hearts", totals, increments)
+        return totals
+
+    def load_users(self):
+        return self._users(self._connect(), None)
+
+    @staticmethod
+    def _chunks(values):
+        values = list(values)
+        for start in range(0, len(values), SQLITE_MAX_PARAMS):
+            yield values[start:start + SQLITE_MAX_PARAMS]
+
+    def _users(self, conn, usernames):
+        query = "SELECT username, password, email, created_at, id FROM users"
+        if usernames is None:
+            rows = conn.execute(query).fetchall()
+        else:
+            rows = []
+            for chunk in self._chunks(usernames):
+                marks = ",".join("?" * len(chunk))
+                rows += conn.execute(f"{query} WHERE username IN ({marks})", chunk).fetchall()
+        return {
+            username: {"password": password, "email": email,
+                       "created_at": created_at, "id": user_id}
+            for username, password, email, created_at, user_id in rows
+        }
+
+    def add_user(self, username, record):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO users (username, password, email, created_at, id) VALUES (?, ?, ?, ?, ?)",
+                    (username, record["password"], record["email"],
+                     record["created_at"], record["id"]),
+                )
+                self._log(conn, "user", [username])
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    # One insert and one counter update, whatever the size of the corpus
+    def add_comment(self, content_id, comment):
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE content SET comment_count = comment_count + 1 WHERE id = ?"
+                " RETURNING comment_count",
+                (content_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(content_id)
+            conn.execute(
+                "INSERT INTO comments (content_id, author, text, created_at) VALUES (?, ?, ?, ?)",
+                (content_id, comment["author"], comment["text"], comment["created_at"]),
+            )
+            self._log(conn, "comments", [content_id])
+        metrics.count("bytes_written_total", len(comment["text"]), source="sqlite")
+        return row[0]
+
+    def list_comments(self, content_id, after=0, limit=COMMENT_PAGE_SIZE):
+        rows = self._connect().execute(
+            "SELECT seq, author, text, created_at FROM comments"
+            " WHERE content_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (content_id, after, limit),
+        ).fetchall()
+        return [
+            (seq, {"author": author, "text": text, "created_at": created_at})
+            for seq, author, text, created_at in rows
+        ]
+
+    def version(self):
+        row = self._connect().execute("SELECT MAX(seq) FROM changes").fetchone()
+        return row[0] or 0
+
+    def changes_since(self, version):
+        conn = self._connect()
+        # One read transaction so the journal and the rows agree
+        conn.execute("BEGIN")
+        try:
+            first, last = conn.execute("SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+            if first is not None and version < first - 1:
+                return None
+            rows = conn.execute(
+                "SELECT op, ref, at, amount FROM changes WHERE seq > ? ORDER BY seq", (version,)
+            ).fetchall()
+            refs = {"content": {}, "hearts": {}, "user": {}, "comments": {}}
+            heart_events = []
+            for op, ref, at, amount in rows:
+                refs[op][ref] = None
+                if op == "hearts" and at is not None and amount:
+                    heart_events.append((ref, amount, at))
+
+            content = []
+            for chunk in self._chunks(refs["content"]):
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    "SELECT kind, body, hearts, comment_count FROM content"
+                    f" WHERE id IN ({marks}) ORDER BY seq",
+                    chunk,
+                ).fetchall()
+                metrics.count("bytes_read_total", sum(len(row[1]) for row in rows), source="sqlite")
+                content += [(row[0], self._row_to_item(*row[1:])) for row in rows]
+            hearts = {}
+            for chunk in self._chunks(refs["hearts"]):
+                marks = ",".join("?" * len(chunk))
+                hearts.update(conn.execute(
+                    f"SELECT id, hearts FROM content WHERE id IN ({marks})", chunk
+                ))
+            comments = {}
+            for chunk in self._chunks(refs["comments"]):
+                marks = ",".join("?" * len(chunk))
+                comments.update(conn.execute(
+                    f"SELECT id, comment_count FROM content WHERE id IN ({marks})", chunk
+                ))
+            users = self._users(conn, refs["user"]) if refs["user"] else {}
+        finally:
+            conn.execute("COMMIT")
+        return Changes(last or 0, content, hearts, users, comments, heart_events)
+
+    def get_meta(self, key, default=None):
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class JSONStorage(Storage):
+    """The original layout: one JSON file per collection, rewritten in full."""
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self._thread_lock = threading.Lock()
+
+    # Read-modify-write cycles are serialized across threads and processes
+    @contextmanager
+    def _lock(self):
+        with self._thread_lock, file_lock(self.data_dir / LOCK_FILENAME):
+            yield
+
+    def _path(self, kind):
+        return self.data_dir / JSON_FILENAMES[kind]
+
+    def _read(self, path, default):
+        if path.exists():
+            with open(path, "r") as f:
+                data = json.load(f)
+                metrics.count("bytes_read_total", os.fstat(f.fileno()).st_size, source="json")
+                return data
+        return default
+
+    def _write(self, path, data):
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            metrics.count("bytes_written_total", f.tell(), source="json")
+        os.replace(tmp_path, path)
+
+    def _load(self, kind):
+        return self._read(self._path(kind), [])
+
+    def list_content(self, kind):
+        data = self._load(kind)
+        if all(item.get("id") for item in data):
+            return data
+        # Records written before posts had ids get them once, under the lock
+        with self._lock():
+            data = self._load(kind)
+            if not all(item.get("id") for item in data):
+                for item in data:
+                    ensure_content_id(item)
+                self._write(self._path(kind), data)
+        return data
+
+    def add_content(self, kind, item):
+        self.import_content(kind, [item])
+        return item
+
+    def import_content(self, kind, items):
+        with self._lock():
+            data = self._load(kind)
+            data.extend(ensure_content_id(item) for item in items)
+            self._write(self._path(kind), data)
+
+    def add_hearts_batch(self, increments):
+        totals = {}
+        with self._lock():
+            for kind in CONTENT_KINDS:
+                data = self._load(kind)
+                changed = False
+                for item in data:
+                    if item.get("id") in increments:
+                        item["hearts"] = item.get("hearts", 0) + increments[item["id"]]
+                        totals[item["id"]] = item["hearts"]
+                        changed = True
+                if changed:
+                    self._write(self._path(kind), data)
+        return totals
+
+    def load_users(self):
+        return self._read(self.data_dir / USERS_FILENAME, {})
+
+    def add_user(self, username, record):
+        with self._lock():
+            users = self.load_users()
+            if username in users:
+                return False
+            users[username] = record
+            self._write(self.data_dir / USERS_FILENAME, users)
+        return True
+
+    # Threads are append-only files, data/comments/<id>.jsonl; the count
+    # cached on the post still means rewriting its collection, as hearts do.
+    def _thread_path(self, content_id):
+        return self.data_dir / COMMENTS_DIRNAME / f"{content_id}.jsonl"
+
+    def add_comment(self, content_id, comment):
+        with self._lock():
+            for kind in CONTENT_KINDS:
+                data = self._load(kind)
+                for item in data:
+                    if item.get("id") == content_id:
+                        break
+                else:
+                    continue
+                path = self._thread_path(content_id)
+                path.parent.mkdir(exist_ok=True)
+                with open(path, "a") as f:
+                    f.write(json.dumps(comment) + "\n")
+                item["comment_count"] = item.get("comment_count", 0) + 1
+                self._write(self._path(kind), data)
+                return item["comment_count"]
+        raise KeyError(content_id)
+
+    def list_comments(self, content_id, after=0, limit=COMMENT_PAGE_SIZE):
+        path = self._thread_path(content_id)
+        if not path.exists():
+            return []
+        page = []
+        with open(path, "r") as f:
+            for position, line in enumerate(f, 1):
+                if position <= after:
+                    continue
+                if len(page) == limit:
+                    break
+                page.append((position, json.loads(line)))
+        return page
+
+    def version(self):
+        paths = [self._path(kind) for kind in CONTENT_KINDS]
+        paths.append(self.data_dir / USERS_FILENAME)
+        return tuple(p.stat().st_mtime_ns if p.exists() else 0 for p in paths)
+
+
+BACKENDS = {
+    "sqlite": lambda data_dir: SQLiteStorage(Path(data_dir) / DB_FILENAME),
+    "json": JSONStorage,
+}
+
+
+def migrate_json(storage, data_dir):
+    """Copy the legacy JSON files into ``storage`` once.
+
+    The JSON files are left in place; a meta flag records that the import
+    happened so it is never repeated. Records without an id get
+    ``legacy_content_id``, so if an import is cut short, the next one
+    skips what was already copied instead of adding it again.
+    """
+    if storage.get_meta("json_migrated"):
+        return False
+    data_dir = Path(data_dir)
+    # Several processes may start at once; only the first one imports.
+    with file_lock(data_dir / LOCK_FILENAME):
+        if storage.get_meta("json_migrated"):
+            return False
+        legacy = JSONStorage(data_dir)
+        for kind in CONTENT_KINDS:
+            items = legacy._load(kind)
+            for position, item in enumerate(items):
+                if not item.get("id"):
+                    item["id"] = legacy_content_id(kind, position, item)
+            existing = storage.existing_ids([item["id"] for item in items])
+            storage.import_content(kind, [item for item in items if item["id"] not in existing])
+        for username, record in legacy.load_users().items():
+            storage.add_user(username, record)
+        storage.set_meta("json_migrated", 1)
+    return True
+
+
+def open_storage(data_dir, backend=None):
+    """Open the configured backend (``CULTURE_SWAP_STORAGE``, default sqlite)."""
+    backend = backend or os.environ.get("CULTURE_SWAP_STORAGE", "sqlite")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    storage = BACKENDS[backend](data_dir)
+    if backend != "json":
+        migrate_json(storage, data_dir)
+    return storage
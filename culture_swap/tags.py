@@ -0,0 +1,130 @@
+"""Inverted index from tag values to bitmaps of content.
+
+Every recipe and story gets a document number in insertion order. For
+each facet (culture, season, dietary) the index maps a tag value to an
+``int`` used as a bitmap over those numbers, so filtering is OR within a
+facet and AND across facets, and facet counts are popcounts.
+"""
+from types import MappingProxyType
+
+# facet -> (content field, whether items without the field pass a filter on it).
+# Stories carry no dietary tags, so a dietary filter has never hidden them.
+FACETS = MappingProxyType({
+    "culture": ("culture_tags", False),
+    "season": ("season", False),
+    "dietary": ("dietary_tags", True),
+})
+
+
+class TagIndex:
+    """Immutable facet index; ``with_items`` returns an updated copy."""
+
+    __slots__ = ("docnos", "size", "postings", "missing")
+
+    def __init__(self, docnos=None, size=0, postings=None, missing=None):
+        # ``docnos`` only ever grows, so copies can safely share it.
+        self.docnos = {} if docnos is None else docnos
+        self.size = size
+        self.postings = postings or {facet: {} for facet in FACETS}
+        self.missing = missing or {facet: 0 for facet in FACETS}
+
+    @classmethod
+    def build(cls, content):
+        # ORing bits into growing ints copies the bitmap every time, so
+        # collect docnos per value first and make each bitmap once
+        index = cls()
+        docnos = {facet: {} for facet in FACETS}
+        missing = {facet: [] for facet in FACETS}
+        for items in content.values():
+            for item in items:
+                docno = index.docnos.setdefault(item["id"], index.size)
+                index.size = max(index.size, docno + 1)
+                for facet, (field, _) in FACETS.items():
+                    if field not in item:
+                        missing[facet].append(docno)
+                        continue
+                    postings = docnos[facet]
+                    for value in item[field]:
+                        postings.setdefault(value, []).append(docno)
+        for facet in FACETS:
+            index.postings[facet] = {
+                value: index._bitmap(found) for value, found in docnos[facet].items()
+            }
+            index.missing[facet] = index._bitmap(missing[facet])
+        return index
+
+    def _bitmap(self, docnos):
+        if not docnos:
+            return 0
+        import numpy as np
+
+        bits = np.zeros(self.size, bool)
+        bits[docnos] = True
+        return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+    def _add(self, item):
+        docno = self.docnos.setdefault(item["id"], self.size)
+        self.size = max(self.size, docno + 1)
+        bit = 1 << docno
+        for facet, (field, _) in FACETS.items():
+            if field not in item:
+                self.missing[facet] |= bit
+                continue
+            postings = self.postings[facet]
+            for value in item[field]:
+                postings[value] = postings.get(value, 0) | bit
+
+    def with_items(self, items):
+        index = TagIndex(
+            self.docnos,
+            self.size,
+            {facet: dict(postings) for facet, postings in self.postings.items()},
+            dict(self.missing),
+        )
+        for item in items:
+            index._add(item)
+        return index
+
+    def values(self, facet):
+        """Tag values of ``facet`` that at least one item carries."""
+        return sorted(self.postings[facet])
+
+    def _facet_mask(self, facet, values):
+        postings = self.postings[facet]
+        mask = 0
+        for value in values:
+            mask |= postings.get(value, 0)
+        if FACETS[facet][1]:
+            mask |= self.missing[facet]
+        return mask
+
+    def query(self, selected, skip=None):
+        """Bitmap of items matching every facet in ``selected``.
+
+        ``selected`` maps facet names to chosen values; facets with no
+        values are ignored. Returns None when nothing is selected.
+        """
+        mask = None
+        for facet, values in selected.items():
+            if not values or facet == skip:
+                continue
+            facet_mask = self._facet_mask(facet, values)
+            mask = facet_mask if mask is None else mask & facet_mask
+        return mask
+
+    def counts(self, facet, selected):
+        """``{value: count}`` for ``facet`` under the other facets' selections."""
+        mask = self.query(selected, skip=facet)
+        return {
+            value: (posting if mask is None else posting & mask).bit_count()
+            for value, posting in sorted(self.postings[facet].items())
+        }
+
+    def to_array(self, mask):
+        """Boolean array indexed by docno for a ``query`` result (None stays None)."""
+        if mask is None:
+            return None
+        import numpy as np
+
+        data = np.frombuffer(mask.to_bytes((self.size + 7) // 8 or 1, "little"), np.uint8)
+        return np.unpackbits(data, bitorder="little")[:self.size].astype(bool)
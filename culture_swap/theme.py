@@ -0,0 +1,99 @@
+"""Colour palettes and the custom CSS for each theme.
+
+The CSS depends only on the palette, so it is rendered once per process
+when this module is imported instead of on every rerun.
+"""
+
+# Color Palette
+COLORS = {
+    "light": {
+        "primary": "#FF8DC7",  # Soft pink
+        "secondary": "#FFB3D1",  # Light pink
+        "accent": "#FF69B4",  # Hot pink
+        "background": "#FFF0F5",  # Lavender blush
+        "text": "#4A4A4A",  # Dark gray
+        "success": "#85D2B5",  # Mint green
+        "card_bg": "#FFFFFF",  # White for cards
+        "border": "#FFE4E1",  # Misty rose
+    },
+    "dark": {
+        "primary": "#FF69B4",  # Hot pink
+        "secondary": "#DB7093",  # Pale violet red
+        "accent": "#FF1493",  # Deep pink
+        "background": "#2F2F2F",  # Dark background
+        "text": "#FFFFFF",  # White text
+        "success": "#85D2B5",  # Mint green
+        "card_bg": "#3D3D3D",  # Darker gray for cards
+        "border": "#4A4A4A",  # Dark gray for borders
+    }
+}
+
+
+def _theme_css(colors):
+    return f"""
+    <style>
+        .stApp {{
+            background-color: {colors['background']};
+            color: {colors['text']};
+        }}
+        .stButton>button {{
+            background-color: {colors['primary']};
+            color: white;
+            border-radius: 20px;
+            transition: all 0.3s ease;
+        }}
+        .stButton>button:hover {{
+            transform: translateY(-2px);
+            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+        }}
+        .stTextInput>div>div>input {{
+            color: {colors['text']};
+            border-radius: 10px;
+        }}
+        .stSelectBox>div>div>input {{
+            color: {colors['text']};
+        }}
+        .feed-card {{
+            background-color: {colors['card_bg']};
+            padding: 20px;
+            border-radius: 15px;
+            border: 1px solid {colors['border']};
+            margin: 10px 0;
+            transition: all 0.3s ease;
+        }}
+        .feed-card:hover {{
+            transform: translateY(-5px);
+            box-shadow: 0 8px 16px rgba(0,0,0,0.1);
+        }}
+        .user-info {{
+            display: flex;
+            align-items: center;
+            margin-bottom: 10px;
+        }}
+        .user-avatar {{
+            width: 40px;
+            height: 40px;
+            border-radius: 50%;
+            margin-right: 10px;
+        }}
+        .timestamp {{
+            color: {colors['text']};
+            opacity: 0.7;
+            font-size: 0.8em;
+        }}
+        .interaction-buttons {{
+            display: flex;
+            gap: 10px;
+            margin-top: 10px;
+        }}
+        .stTabs {{
+            background-color: {colors['card_bg']};
+            border-radius: 10px;
+            padding: 10px;
+        }}
+    </style>
+    """
+
+
+# Custom CSS for each theme, keyed like COLORS
+THEME_CSS = {theme: _theme_css(colors) for theme, colors in COLORS.items()}
@@ -0,0 +1,175 @@
+"""Trending order: recipes and stories ranked by time-decayed hearts.
+
+A heart given at time ``t`` is worth ``2 ** -((now - t) / half_life)``.
+Scores use forward decay: each heart adds ``2 ** (t / half_life)``
+instead, and the score is stored as a logarithm so it never overflows.
+Every score shrinks by the same factor as time passes, so the order
+never has to be recomputed. It only changes when hearts arrive, and then
+only the hearted items move.
+
+Storage keeps heart totals, not when each heart was given. When the
+order is first built, an item's hearts count from its ``date_added``.
+Later hearts count from when the storage journal says they were written,
+so every process ranks them the same however late it catches up; without
+a journal they count from when the snapshot sees them. Each post also
+starts with ``post_weight`` hearts' worth of score on its date, so new
+posts can show up before anyone hearts them.
+
+The order is a sorted list of ``(-score, id)`` kept with ``bisect``.
+Reading a page walks it from the top, so a tag filter mask only costs
+the entries it skips.
+"""
+import bisect
+import math
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+HALF_LIFE_HOURS = 48.0
+POST_WEIGHT = 1.0
+HALF_LIFE_ENV = "CULTURE_SWAP_TRENDING_HALF_LIFE"
+POST_WEIGHT_ENV = "CULTURE_SWAP_TRENDING_POST_WEIGHT"
+DATE_FORMAT = "%Y-%m-%d"
+
+TrendingCursor = namedtuple("TrendingCursor", "key id")
+
+
+def decay_settings():
+    """``(half_life_hours, post_weight)`` from the environment or the defaults."""
+    half_life = float(os.environ.get(HALF_LIFE_ENV) or HALF_LIFE_HOURS)
+    post_weight = float(os.environ.get(POST_WEIGHT_ENV) or POST_WEIGHT)
+    if half_life <= 0 or post_weight < 0:
+        raise ValueError(f"{HALF_LIFE_ENV} must be positive and {POST_WEIGHT_ENV} non-negative")
+    return half_life, post_weight
+
+
+# Posts share dates, and strptime is the slow part of a build
+@lru_cache(maxsize=4096)
+def _timestamp(date):
+    return datetime.strptime(date, DATE_FORMAT).timestamp()
+
+
+def _log_add(a, b):
+    # log(exp(a) + exp(b)) without leaving log space
+    if a == -math.inf:
+        return b
+    if b == -math.inf:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+class Trending:
+    """Immutable trending order; ``with_*`` methods return updated copies."""
+
+    __slots__ = ("half_life", "post_weight", "_rate", "_scores", "_order")
+
+    def __init__(self, half_life=None, post_weight=None, scores=None, order=None):
+        if half_life is None or post_weight is None:
+            default_half_life, default_post_weight = decay_settings()
+            half_life = default_half_life if half_life is None else half_life
+            post_weight = default_post_weight if post_weight is None else post_weight
+        self.half_life = half_life
+        self.post_weight = post_weight
+        self._rate = math.log(2) / (half_life * 3600)
+        self._scores = {} if scores is None else scores
+        self._order = [] if order is None else order
+
+    @classmethod
+    def build(cls, content, half_life=None, post_weight=None):
+        trending = cls(half_life, post_weight)
+        for items in content.values():
+            for item in items:
+                trending._scores[item["id"]] = trending._initial(item)
+        trending._order = sorted((-score, content_id) for content_id, score in trending._scores.items())
+        return trending
+
+    def __len__(self):
+        return len(self._order)
+
+    def _copy(self):
+        return Trending(self.half_life, self.post_weight, dict(self._scores), list(self._order))
+
+    @staticmethod
+    def _posted(item):
+        return _timestamp(item["date_added"])
+
+    def _weight(self, hearts, at):
+        """Log of ``hearts`` given at time ``at``, forward-decayed."""
+        if hearts <= 0:
+            return -math.inf
+        return math.log(hearts) + self._rate * at
+
+    def _initial(self, item):
+        # The post's own weight plus the hearts it has, both from its date
+        posted = self._posted(item)
+        score = self._weight(self.post_weight, posted)
+        return _log_add(score, self._weight(item.get("hearts", 0), posted))
+
+    def _move(self, content_id, score):
+        old = self._scores.get(content_id)
+        if old is not None:
+            del self._order[bisect.bisect_left(self._order, (-old, content_id))]
+        self._scores[content_id] = score
+        bisect.insort(self._order, (-score, content_id))
+
+    def with_items(self, items):
+        trending = self._copy()
+        added = []
+        for item in items:
+            # Scored as a fresh build would, so a process that first sees a
+            # post with hearts already on it ranks it like one that just started
+            score = trending._initial(item)
+            if item["id"] in trending._scores:
+                trending._move(item["id"], score)
+            else:
+                trending._scores[item["id"]] = score
+                added.append((-score, item["id"]))
+        if added:
+            # One sort of the mostly ordered list beats an insort per item
+            trending._order.extend(added)
+            trending._order.sort()
+        return trending
+
+    def with_hearts(self, added, now=None):
+        """Copy with ``added`` (content id -> new hearts) counted at ``now``."""
+        now = time.time() if now is None else now
+        return self.with_heart_events([(content_id, hearts, now) for content_id, hearts in added.items()])
+
+    def with_heart_events(self, events):
+        """Copy with ``events``, ``(content_id, hearts, unix time given)``, counted."""
+        trending = self._copy()
+        for content_id, hearts, at in events:
+            if hearts > 0 and content_id in trending._scores:
+                score = _log_add(trending._scores[content_id], trending._weight(hearts, at))
+                trending._move(content_id, score)
+        return trending
+
+    def score(self, content_id, now=None):
+        """Decayed heart score of ``content_id`` at ``now``."""
+        now = time.time() if now is None else now
+        return math.exp(self._scores[content_id] - self._rate * now)
+
+    def page(self, cursor=None, limit=10, mask=None, docnos=None):
+        """Up to ``limit`` ids after ``cursor``, hottest first.
+
+        ``mask`` is an optional boolean array indexed by the docnos in
+        ``docnos``. The second value is the cursor for the following page,
+        or None when no more items match.
+        """
+        order = self._order
+        start = 0 if cursor is None else bisect.bisect_right(order, tuple(cursor))
+        ids = []
+        for position in range(start, len(order)):
+            _, content_id = order[position]
+            if mask is not None:
+                docno = docnos[content_id]
+                if docno >= len(mask) or not mask[docno]:
+                    continue
+            if len(ids) == limit:
+                last = order[ids[-1]]
+                return [order[i][1] for i in ids], TrendingCursor(*last)
+            ids.append(position)
+        return [order[i][1] for i in ids], None
@@ -0,0 +1,191 @@
+"""Resized WebP variants of uploaded photos, made in a process pool.
+
+For every stored image the pool writes ``<hash>.w<width>.webp`` next to
+it, one per width in ``WIDTHS``, with the EXIF orientation applied (and
+the EXIF data dropped). A width larger than the photo itself is written
+once, at the photo's own size. The feed picks the smallest variant wide
+enough for where the image is shown and links to the original. Until the
+variants exist, or if they cannot be made, it shows the original, so a
+slow or failed job only costs bandwidth.
+
+Decoding and resizing run in a pool of worker processes
+(``python -m culture_swap.variants``), so they do not compete with the
+server for the GIL. Each one takes a path per line on stdin and answers
+on stdout. ``multiprocessing`` is not used: under ``streamlit run``,
+``__main__`` is the app script, so spawned workers would re-run the
+whole app. Images stored before this module existed are queued the
+first time the feed shows them.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import metrics
+
+WIDTHS = (320, 640, 1280)
+# Widest a feed image is drawn, in device pixels: a full-width card on a 2x screen
+FEED_WIDTH = 1280
+WEBP_QUALITY = 80
+WORKERS = 2
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+logger = logging.getLogger(__name__)
+
+
+def is_image(path):
+    return str(path).lower().endswith(IMAGE_EXTENSIONS)
+
+
+def variant_path(path, width):
+    return Path(path).with_suffix(f".w{width}.webp")
+
+
+def existing_variants(path):
+    """``{width: path}`` of the variants of ``path`` written so far."""
+    variants = {}
+    for width in WIDTHS:
+        candidate = variant_path(path, width)
+        if candidate.exists():
+            variants[width] = candidate
+    return variants
+
+
+def pick_variant(variants, width):
+    """Smallest variant at least ``width`` wide, else the largest there is."""
+    for candidate in sorted(variants):
+        if candidate >= width:
+            return variants[candidate]
+    return variants[max(variants)] if variants else None
+
+
+def make_variants(path, widths=WIDTHS, quality=WEBP_QUALITY):
+    """Write the WebP variants of the image at ``path``; returns bytes written.
+
+    Runs in a worker process. Each file is written to a temporary name and
+    renamed, so readers never see half of one.
+    """
+    from PIL import Image, ImageOps
+
+    written = 0
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        for width in widths:
+            target = variant_path(path, width)
+            if target.exists():
+                continue
+            resized = image
+            if image.width > width:
+                resized = image.resize((width, max(1, round(image.height * width / image.width))),
+                                       Image.LANCZOS)
+            fd, tmp_name = tempfile.mkstemp(suffix=".webp", dir=target.parent)
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    resized.save(out, "WEBP", quality=quality, method=4)
+                    written += out.tell()
+                os.replace(tmp_name, target)
+            finally:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+            if image.width <= width:
+                break
+    return written
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+_local = threading.local()
+
+
+def _in_worker(path):
+    # Each pool thread drives one long-lived worker process, restarted if it dies
+    worker = getattr(_local, "worker", None)
+    if worker is None or worker.poll() is not None:
+        env = dict(os.environ)
+        package_root = str(Path(__file__).resolve().parent.parent)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, (package_root, env.get("PYTHONPATH"))))
+        worker = _local.worker = subprocess.Popen(
+            [sys.executable, "-m", __name__], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, env=env,
+        )
+    worker.stdin.write(json.dumps(str(path)) + "\n")
+    worker.stdin.flush()
+    answer = worker.stdout.readline()
+    if not answer:
+        raise WorkerError(f"worker exited with status {worker.wait()}")
+    answer = json.loads(answer)
+    if "error" in answer:
+        raise WorkerError(answer["error"])
+    return answer["written"]
+
+
+class VariantPipeline:
+    """Queues images for the worker processes and remembers what is in flight."""
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+        self._failed = set()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="image-variants")
+        return self._executor
+
+    def submit(self, path):
+        """Queue ``path`` unless it is already queued or has failed before."""
+        path = str(path)
+        with self._lock:
+            if path in self._pending or path in self._failed:
+                return False
+            self._pending.add(path)
+            future = self._pool().submit(_in_worker, path)
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return True
+
+    def _finished(self, path, future):
+        with self._lock:
+            self._pending.discard(path)
+            error = future.exception() if not future.cancelled() else None
+            if error is not None:
+                self._failed.add(path)
+        if error is not None:
+            logger.warning("Making image variants of %s failed: %s", path, error)
+        elif not future.cancelled():
+            metrics.count("bytes_written_total", future.result(), source="variants")
+
+    def variant(self, path, width):
+        """Best variant of ``path`` for ``width`` pixels, or None while there is none.
+
+        Queues images that have no variants yet.
+        """
+        variants = existing_variants(path)
+        metrics.count("cache_requests_total", cache="variant", result="hit" if variants else "miss")
+        if not variants:
+            self.submit(path)
+            return None
+        return pick_variant(variants, width)
+
+
+def main():
+    for line in sys.stdin:
+        try:
+            answer = {"written": make_variants(json.loads(line))}
+        except Exception as e:
+            answer = {"error": f"{type(e).__name__}: {e}"}
+        print(json.dumps(answer), flush=True)
+
+
+if __name__ == "__main__":
+    main()
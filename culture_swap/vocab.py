@@ -0,0 +1,9 @@
+"""Tag vocabularies offered by the recipe, story and filter forms."""
+from ._countries import COUNTRY_NAMES
+
+# Get all countries for cultural tags
+CULTURE_TAGS = COUNTRY_NAMES
+MEAL_TAGS = ("Breakfast", "Lunch", "Dinner", "Dessert", "Snack", "Appetizer", "Beverage")
+DIETARY_TAGS = ("Vegetarian", "Vegan", "Gluten-Free", "Kid-Friendly", "Dairy-Free", "Nut-Free", "Halal", "Kosher")
+OCCASION_TAGS = ("Festival", "Wedding", "Birthday", "Holiday", "Everyday", "Religious", "Celebration")
+SEASONS = ("Spring", "Summer", "Fall", "Winter")
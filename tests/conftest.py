@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from culture_swap.storage import RECIPE, STORY, open_storage  # noqa: E402
+
+CULTURES = ("Nigeria", "India", "Mexico", "Japan")
+INGREDIENTS = ("2 cups rice", "3 tomatoes", "1 onion", "garlic", "200g chicken", "chili")
+
+
+def recipe(number, **fields):
+    item = {
+        "title": f"Recipe {number}",
+        "description": "",
+        "ingredients": [INGREDIENTS[(number + offset) % len(INGREDIENTS)] for offset in range(3)],
+        "instructions": "Cook.",
+        "culture_tags": [CULTURES[number % len(CULTURES)]],
+        "meal_type": ["Dinner"],
+        "dietary_tags": ["Vegan"] if number % 3 == 0 else [],
+        "season": [],
+        # Several posts per day, so paging has to break date ties by id
+        "date_added": f"2024-01-{number // 3 + 1:02d}",
+        "hearts": 0,
+        "media": [],
+    }
+    item.update(fields)
+    return item
+
+
+def story(number, **fields):
+    item = {
+        "title": f"Story {number}",
+        "story": "Once...",
+        "culture_tags": [CULTURES[number % len(CULTURES)]],
+        "occasion": ["Festival"],
+        "date_added": f"2024-01-{number // 3 + 1:02d}",
+        "hearts": 0,
+        "media": [],
+    }
+    item.update(fields)
+    return item
+
+
+def corpus(size):
+    """``size`` posts as (kind, item), two recipes to every story."""
+    return [(STORY, story(n)) if n % 3 == 2 else (RECIPE, recipe(n)) for n in range(size)]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = open_storage(tmp_path, backend="sqlite")
+    yield storage
+    storage.close()
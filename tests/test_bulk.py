@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from conftest import recipe, story
+
+from culture_swap.bulk import import_ndjson, validate
+
+
+def line(record):
+    return json.dumps(record) + "\n"
+
+
+@pytest.mark.parametrize("record, error", [
+    ([], "not a JSON object"),
+    ("recipe", "not a JSON object"),
+    ({}, "kind must be"),
+    ({"kind": "poem"}, "kind must be"),
+    ({"kind": ["recipe"]}, "kind must be"),
+    ({"kind": {}}, "kind must be"),
+    ({"kind": None}, "kind must be"),
+    (dict(recipe(1), kind="recipe", title=""), "title is required"),
+    (dict(story(1), kind="story", story=None), "story is required"),
+    (dict(recipe(1), kind="recipe", rating=5), "unknown field"),
+    (dict(recipe(1), kind="recipe", hearts=-1), "non-negative integer"),
+    (dict(recipe(1), kind="recipe", hearts=True), "non-negative integer"),
+    (dict(recipe(1), kind="recipe", hearts="3"), "non-negative integer"),
+    (dict(recipe(1), kind="recipe", title=["Jollof"]), "must be a string"),
+    (dict(recipe(1), kind="recipe", ingredients="rice"), "must be a list"),
+    (dict(recipe(1), kind="recipe", ingredients=["rice", 2]), "list of strings"),
+    (dict(recipe(1), kind="recipe", culture_tags=["Atlantis"]), "unknown culture_tags"),
+    (dict(recipe(1), kind="recipe", culture_tags=[["India"]]), "list of strings"),
+    (dict(story(1), kind="story", occasion=["Tuesday"]), "unknown occasion"),
+    (dict(recipe(1), kind="recipe", date_added="01/02/2024"), "date_added must look like"),
+    (dict(recipe(1), kind="recipe", media=["missing.jpg"]), "media file not found"),
+    (dict(recipe(1), kind="recipe", id=7), "must be a string"),
+])
+def test_validate_rejects_malformed_records(record, error):
+    with pytest.raises(ValueError, match=error):
+        validate(record)
+
+
+def test_validate_fills_in_what_the_forms_write():
+    kind, item = validate({"kind": "story", "title": "Tet", "story": "Lanterns"})
+    assert kind == "story"
+    assert item["culture_tags"] == [] and item["hearts"] == 0 and item["date_added"]
+    assert "kind" not in item
+
+
+def test_bad_lines_are_reported_without_stopping_the_import(storage):
+    rejected = []
+    lines = [
+        line(dict(recipe(1), kind="recipe")),
+        "{not json\n",
+        line({"kind": ["recipe"]}),
+        "\n",
+        line(dict(story(2), kind="story")),
+        line(dict(recipe(3), kind="recipe", hearts=-1)),
+    ]
+    report = import_ndjson(storage, lines, batch_size=1,
+                           on_reject=lambda number, error, text: rejected.append((number, text)))
+    assert (report.imported, report.rejected, report.lines) == (2, 3, 6)
+    assert [number for number, _ in report.rejects] == [2, 3, 6]
+    assert rejected[0] == (2, "{not json")
+
+
+def test_reimporting_records_without_ids_adds_nothing(storage):
+    lines = [line(dict(recipe(n), kind="recipe")) for n in range(5)]
+    first = import_ndjson(storage, lines, batch_size=2)
+    second = import_ndjson(storage, lines, batch_size=2)
+    assert (first.imported, first.skipped) == (5, 0)
+    assert (second.imported, second.skipped) == (0, 5)
+    assert len(storage.list_content("recipe")) == 5
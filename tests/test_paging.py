@@ -0,0 +1,88 @@
+import pytest
+from conftest import corpus
+
+from culture_swap.feed import Timeline
+from culture_swap.storage import RECIPE, STORY, ensure_content_id
+from culture_swap.tags import TagIndex
+from culture_swap.trending import Trending
+
+
+@pytest.fixture
+def content():
+    content = {RECIPE: [], STORY: []}
+    for number, (kind, item) in enumerate(corpus(40)):
+        item["hearts"] = (number * 7) % 11
+        content[kind].append(ensure_content_id(item))
+    return {kind: tuple(items) for kind, items in content.items()}
+
+
+def all_items(content):
+    return [item for items in content.values() for item in items]
+
+
+def pages(fetch, limit):
+    """Every id from following cursors, checking no page is over ``limit``."""
+    ids, cursor = [], None
+    while True:
+        page, cursor = fetch(cursor, limit)
+        assert len(page) <= limit
+        ids.extend(page)
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 7, 10, 40, 100])
+@pytest.mark.parametrize("selected", [None, {"culture": ["India"]}, {"culture": ["Japan", "Nigeria"], "dietary": ["Vegan"]}])
+def test_timeline_pages_cover_the_filtered_feed_in_order(content, limit, selected):
+    tags = TagIndex.build(content)
+    timeline = Timeline.build(content, tags.docnos)
+    mask = tags.to_array(tags.query(selected)) if selected else None
+
+    def fetch(cursor, n):
+        page, next_cursor = timeline.page(cursor, n, mask)
+        return [entry.id for entry in page], next_cursor
+
+    ids = pages(fetch, limit)
+
+    matching = [item for item in all_items(content) if mask is None or mask[tags.docnos[item["id"]]]]
+    expected = [item["id"] for item in sorted(matching, key=lambda i: (i["date_added"], i["id"]), reverse=True)]
+    assert ids == expected
+
+
+def test_timeline_cursor_survives_new_posts(content):
+    tags = TagIndex.build(content)
+    timeline = Timeline.build(content, tags.docnos)
+    first, cursor = timeline.page(None, 10)
+    # A newer post arriving between pages must not shift the next page
+    newest = ensure_content_id(dict(all_items(content)[0], date_added="2024-12-31"))
+    tags = tags.with_items([newest])
+    timeline = timeline.with_items([(RECIPE, newest, tags.docnos[newest["id"]])])
+    second, _ = timeline.page(cursor, 10)
+    assert not {e.id for e in first} & {e.id for e in second}
+    assert newest["id"] not in {e.id for e in second}
+    assert second[0].date <= first[-1].date
+
+
+@pytest.mark.parametrize("limit", [1, 6, 10, 100])
+@pytest.mark.parametrize("culture", [None, "Mexico"])
+def test_trending_pages_cover_the_filtered_order(content, limit, culture):
+    tags = TagIndex.build(content)
+    trending = Trending.build(content, half_life=48, post_weight=1)
+    mask = tags.to_array(tags.query({"culture": [culture]})) if culture else None
+
+    ids = pages(lambda cursor, n: trending.page(cursor, n, mask, tags.docnos), limit)
+
+    now = 1_800_000_000
+    matching = [item["id"] for item in all_items(content) if culture is None or culture in item["culture_tags"]]
+    assert sorted(ids) == sorted(matching)
+    scores = [trending.score(content_id, now) for content_id in ids]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_trending_hearts_move_a_post_up(content):
+    trending = Trending.build(content, half_life=48, post_weight=1)
+    last = trending.page(None, len(trending))[0][-1]
+    hearted = trending.with_hearts({last: 1000})
+    assert hearted.page(None, 1)[0] == [last]
+    # The original order is untouched
+    assert trending.page(None, len(trending))[0][-1] == last
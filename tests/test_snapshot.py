@@ -0,0 +1,123 @@
+import pytest
+from conftest import corpus, recipe, story
+
+from culture_swap import snapshot as snapshot_module
+from culture_swap.snapshot import ContentSnapshot, SnapshotStore
+from culture_swap.storage import RECIPE, STORY, open_storage
+
+
+def build_indexes(snapshot):
+    snapshot.timeline
+    snapshot.ingredient_index
+    snapshot.similarity_index
+    snapshot.trending
+
+
+def by_id(snapshot):
+    return {content_id: dict(snapshot.get(content_id)) for kind in snapshot.content
+            for content_id in (item["id"] for item in snapshot.content[kind])}
+
+
+def assert_matches_fresh_load(snapshot, storage):
+    fresh = ContentSnapshot.load(storage)
+    assert snapshot.version == fresh.version
+    assert by_id(snapshot) == by_id(fresh)
+    for kind in (RECIPE, STORY):
+        assert [item["id"] for item in snapshot.content[kind]] == [item["id"] for item in fresh.content[kind]]
+    assert {name: dict(record) for name, record in snapshot.users.items()} == \
+        {name: dict(record) for name, record in fresh.users.items()}
+
+    frame, fresh_frame = snapshot.timeline.frame, fresh.timeline.frame
+    assert frame["id"].tolist() == fresh_frame["id"].tolist()
+    assert frame["hearts"].tolist() == fresh_frame["hearts"].tolist()
+
+    # Docnos follow arrival order, so compare what they select by id
+    def tag_ids(snap, facet, value):
+        docnos = {docno: content_id for content_id, docno in snap.tag_index.docnos.items()}
+        bits = snap.tag_index.postings[facet].get(value, 0)
+        return {docnos[d] for d in range(snap.tag_index.size) if bits >> d & 1}
+
+    for facet, values in (("culture", ["Nigeria", "India"]), ("dietary", ["Vegan"])):
+        for value in values:
+            assert tag_ids(snapshot, facet, value) == tag_ids(fresh, facet, value)
+    assert snapshot.tag_index.counts("culture", {}) == fresh.tag_index.counts("culture", {})
+
+    assert snapshot.ingredient_index.complete("ri") == fresh.ingredient_index.complete("ri")
+    pantry = ["rice", "tomato", "onion"]
+    assert sorted(snapshot.ingredient_index.cook_with(pantry, limit=100)) == \
+        sorted(fresh.ingredient_index.cook_with(pantry, limit=100))
+
+    for content_id in list(snapshot.tag_index.docnos)[:10]:
+        similar = snapshot.similarity_index.similar(snapshot.tag_index.docnos[content_id], limit=100)
+        expected = fresh.similarity_index.similar(fresh.tag_index.docnos[content_id], limit=100)
+        assert sorted(similar) == sorted(expected)
+
+    assert sorted(content_id for _, content_id in snapshot.trending._order) == \
+        sorted(content_id for _, content_id in fresh.trending._order)
+
+
+def test_catch_up_from_another_process_matches_fresh_load(storage, tmp_path):
+    for kind, item in corpus(30):
+        storage.add_content(kind, item)
+    store = SnapshotStore(storage)
+    build_indexes(store.current())
+
+    other = open_storage(tmp_path, backend="sqlite")
+    for kind, item in corpus(60)[30:]:
+        other.add_content(kind, item)
+    ids = [item["id"] for item in store.current().recipes[:5]]
+    other.add_hearts_batch({ids[0]: 3, ids[1]: 1})
+    other.add_hearts_batch({ids[0]: 2})
+    other.add_comment(ids[2], {"author": "ana", "text": "Yum", "created_at": "2024-02-01"})
+    other.add_user("ana", {"password": "x", "email": "a@x", "created_at": "2024-02-01", "id": "u1"})
+    other.close()
+
+    snapshot = store.current()
+    assert snapshot.get(ids[0])["hearts"] == 5
+    assert snapshot.get(ids[2])["comment_count"] == 1
+    assert "ana" in snapshot.users
+    assert_matches_fresh_load(snapshot, storage)
+
+
+def test_own_writes_match_fresh_load(storage):
+    store = SnapshotStore(storage)
+    build_indexes(store.current())
+    for kind, item in corpus(20):
+        store.add_content(kind, item)
+    first = store.current().recipes[0]["id"]
+    store.add_hearts({first: 2})
+    store.add_comment(first, {"author": "ana", "text": "Yum", "created_at": "2024-02-01"})
+    assert_matches_fresh_load(store.current(), storage)
+
+
+def test_catch_up_is_harmless_to_replay(storage):
+    for kind, item in corpus(10):
+        storage.add_content(kind, item)
+    store = SnapshotStore(storage)
+    snapshot = store.current()
+    build_indexes(snapshot)
+    changes = storage.changes_since(0)
+    replayed = snapshot.with_changes(changes)
+    assert by_id(replayed) == by_id(snapshot)
+    assert len(replayed.timeline) == len(snapshot.timeline) == 10
+
+
+def test_large_batches_reload(storage, monkeypatch, tmp_path):
+    monkeypatch.setattr(snapshot_module, "MAX_INCREMENTAL_CONTENT", 5)
+    store = SnapshotStore(storage)
+    build_indexes(store.current())
+    other = open_storage(tmp_path, backend="sqlite")
+    for kind, item in corpus(12):
+        other.add_content(kind, item)
+    other.close()
+    assert_matches_fresh_load(store.current(), storage)
+
+
+@pytest.mark.parametrize("kind, item", [(RECIPE, recipe(0)), (STORY, story(0))])
+def test_first_post_on_an_empty_site_reaches_the_timeline(storage, kind, item):
+    store = SnapshotStore(storage)
+    assert len(store.current().timeline) == 0
+    store.add_content(kind, item)
+    page, cursor = store.current().timeline.page()
+    assert [entry.id for entry in page] == [item["id"]]
+    assert cursor is None
@@ -0,0 +1,458 @@
+"""Synthetic-load benchmark for app.py and its backend.
+
+Usage:
+    python tools/bench.py [--sizes 1000,10000,100000,500000] [--out bench.json]
+    python tools/bench.py --compare base.json [--out new.json] [--threshold 0.2]
+
+For every corpus size a fresh worker process generates a synthetic
+SQLite database in a scratch directory. The corpus holds recipes and
+stories with skewed culture tags, ingredients, dates, hearts and shared
+photos, plus ``size // 10`` users. The worker then times:
+
+* backend hot paths called directly: loading the snapshot (``load_data``),
+  building the sorted timeline and the tag index, the first feed page,
+  a filtered page, sorting by hearts, the trending order, indexing and
+  searching, building the ingredient index, autocomplete and "cook with
+  what I have", building the similarity index and a page of "more like
+  this" lookups, and a heart written through storage and read back;
+* the app driven headlessly with AppTest: the login page, logging in,
+  registering, the first Browse run, reruns, filtering, searching, a
+  pantry query, the Trending order and a heart click round trip. AppTest
+  always reruns the whole script, so these numbers are upper bounds for
+  fragment reruns in a browser.
+
+The report is JSON keyed by size and metric. Each metric gives the median
+and minimum in milliseconds over ``--repeat`` runs; cold runs happen only
+once. With ``--compare`` the new medians are checked against a saved
+report. Any metric more than ``--threshold`` slower, and more than
+``--noise-ms`` slower in absolute terms, is listed. The exit status is
+then 1.
+"""
+import argparse
+import atexit
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DEFAULT_SIZES = "1000,10000,100000,500000"
+PASSWORD = "bench-password"
+BATCH_SIZE = 10_000
+MEDIA_FILES = 24
+STORY_SHARE = 0.3
+
+INGREDIENTS = (
+    "rice", "basmati rice", "jasmine rice", "tomatoes", "onions", "red onion", "garlic",
+    "ginger", "scotch bonnet", "chili flakes", "cumin", "coriander", "turmeric",
+    "garam masala", "paprika", "black pepper", "salt", "sugar", "olive oil", "palm oil",
+    "butter", "ghee", "chicken thighs", "beef brisket", "lamb shoulder", "goat meat",
+    "shrimp", "fish sauce", "soy sauce", "lime", "lemon", "coconut milk", "chickpeas",
+    "black beans", "lentils", "plantains", "cassava", "potatoes", "sweet potatoes",
+    "carrots", "bell peppers", "spinach", "cabbage", "eggs", "flour", "cornmeal",
+    "yogurt", "milk", "cilantro", "parsley", "mint", "bay leaves", "cinnamon",
+    "cardamom", "star anise", "rice noodles", "bean sprouts", "peanuts", "sesame seeds",
+    "honey", "dates", "almonds", "saffron", "tamarind", "miso", "tofu", "mushrooms",
+)
+QUANTITIES = ("1", "2", "3", "1/2", "1 1/2", "a pinch of", "to taste")
+UNITS = ("", "cups", "tbsp", "tsp", "g", "kg", "ml", "cloves", "cans", "handfuls")
+DISHES = (
+    "Jollof Rice", "Pho", "Biryani", "Tagine", "Empanadas", "Pierogi", "Ramen",
+    "Feijoada", "Mole", "Dumplings", "Curry", "Stew", "Flatbread", "Soup", "Dal",
+    "Paella", "Shakshuka", "Bobotie", "Adobo", "Goulash", "Couscous", "Tamales",
+)
+OWNERS = ("Grandma's", "Auntie's", "Sunday", "Festival", "Weeknight", "Village",
+          "Street", "Family", "Harvest", "Wedding")
+WORDS = (
+    "we", "always", "made", "this", "every", "winter", "with", "my", "mother", "and",
+    "the", "whole", "family", "gathered", "kitchen", "smell", "of", "spices", "filled",
+    "house", "recipe", "came", "from", "village", "where", "grandparents", "grew", "up",
+    "served", "festival", "neighbors", "shared", "table", "slow", "fire", "market",
+    "morning", "songs", "stories", "children", "learned", "taste", "memory", "home",
+)
+
+
+def zipf_choices(rng, values, k):
+    """``k`` distinct values, skewed towards the start of ``values``."""
+    weights = [1 / (rank + 1) for rank in range(len(values))]
+    return list(dict.fromkeys(rng.choices(values, weights, k=k)))
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize() + "."
+
+
+def make_media(data_dir, count):
+    """Ingest ``count`` small distinct photos and return their paths."""
+    from PIL import Image
+
+    from culture_swap.media import MediaStore
+
+    store = MediaStore(data_dir / "media")
+    paths = []
+    for index in range(count):
+        image = Image.new("RGB", (64, 48), ((index * 37) % 256, (index * 91) % 256, 128))
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        buffer.seek(0)
+        paths.append(store.ingest(buffer, f"photo{index}.png"))
+    return paths
+
+
+def make_corpus(data_dir, size, users, seed):
+    """Write a synthetic corpus into a SQLite store under ``data_dir``."""
+    from culture_swap.storage import RECIPE, STORY, new_content_id, open_storage
+    from culture_swap.vocab import CULTURE_TAGS, DIETARY_TAGS, MEAL_TAGS, OCCASION_TAGS, SEASONS
+
+    rng = random.Random(seed)
+    cultures = list(CULTURE_TAGS)
+    rng.shuffle(cultures)
+    media = make_media(data_dir, MEDIA_FILES)
+    usernames = [f"user{index}" for index in range(users)]
+    start = date.today() - timedelta(days=6 * 365)
+
+    def common():
+        return {
+            "id": new_content_id(),
+            "author": rng.choice(usernames),
+            "culture_tags": zipf_choices(rng, cultures, rng.randint(1, 2)),
+            "date_added": (start + timedelta(days=rng.randrange(6 * 365))).isoformat(),
+            "hearts": min(int(rng.paretovariate(1.2)) - 1, 100_000),
+            "media": rng.sample(media, rng.choice((0, 0, 0, 1, 1, 2))),
+        }
+
+    def recipe():
+        ingredients = [
+            " ".join(filter(None, (rng.choice(QUANTITIES), rng.choice(UNITS), name)))
+            for name in rng.sample(INGREDIENTS, rng.randint(4, 12))
+        ]
+        return dict(
+            common(),
+            title=f"{rng.choice(OWNERS)} {rng.choice(DISHES)}",
+            description=" ".join(sentence(rng, 6, 14) for _ in range(rng.randint(1, 3))),
+            ingredients=ingredients,
+            instructions=" ".join(sentence(rng, 8, 16) for _ in range(rng.randint(2, 5))),
+            meal_type=rng.sample(MEAL_TAGS, rng.randint(1, 2)),
+            dietary_tags=rng.sample(DIETARY_TAGS, rng.choice((0, 0, 1, 1, 2))),
+            season=rng.sample(SEASONS, rng.randint(0, 2)),
+        )
+
+    def story():
+        return dict(
+            common(),
+            title=f"{rng.choice(OWNERS)} {rng.choice(DISHES)} memories",
+            story=" ".join(sentence(rng, 8, 20) for _ in range(rng.randint(3, 8))),
+            occasion=rng.sample(OCCASION_TAGS, rng.randint(0, 2)),
+        )
+
+    storage = open_storage(data_dir, backend="sqlite")
+    remaining = size
+    while remaining:
+        batch = min(remaining, BATCH_SIZE)
+        stories = sum(rng.random() < STORY_SHARE for _ in range(batch))
+        storage.import_content(RECIPE, [recipe() for _ in range(batch - stories)])
+        storage.import_content(STORY, [story() for _ in range(stories)])
+        remaining -= batch
+
+    password = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    for username in usernames:
+        storage.add_user(username, {
+            "password": password,
+            "email": f"{username}@example.com",
+            "created_at": start.isoformat(),
+            "id": new_content_id(),
+        })
+    storage.close()
+    return cultures[0]
+
+
+def measure(func, repeat):
+    """Run ``func`` ``repeat`` times; returns timings and the last result."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(times), 3),
+            "min_ms": round(min(times), 3), "runs": repeat}, result
+
+
+def bench_backend(data_dir, culture, repeat):
+    from culture_swap.feed import PAGE_SIZE
+    from culture_swap.search import SearchIndex
+    from culture_swap.snapshot import ContentSnapshot, SnapshotStore
+    from culture_swap.storage import open_storage
+
+    storage = open_storage(data_dir, backend="sqlite")
+    report = {}
+    report["load_data"], snapshot = measure(lambda: ContentSnapshot.load(storage), 1)
+    report["tag_index_build"], tag_index = measure(lambda: snapshot.tag_index, 1)
+    report["timeline_build"], timeline = measure(lambda: snapshot.timeline, 1)
+
+    selected = {"culture": [culture], "season": [], "dietary": ["Vegetarian"]}
+    report["feed_first_page"], (items, _) = measure(lambda: timeline.page(None, PAGE_SIZE), repeat)
+    report["filter_page"], _ = measure(
+        lambda: timeline.page(None, PAGE_SIZE, tag_index.to_array(tag_index.query(selected))),
+        repeat,
+    )
+    report["filter_counts"], _ = measure(lambda: tag_index.counts("culture", selected), repeat)
+    report["sort_by_hearts"], _ = measure(lambda: timeline.top(PAGE_SIZE), repeat)
+    report["trending_build"], trending = measure(lambda: snapshot.trending, 1)
+    report["trending_page"], _ = measure(lambda: trending.page(None, PAGE_SIZE), repeat)
+    report["trending_filtered_page"], _ = measure(
+        lambda: trending.page(None, PAGE_SIZE, tag_index.to_array(tag_index.query(selected)), tag_index.docnos),
+        repeat,
+    )
+
+    index = SearchIndex()
+    report["search_index_build"], _ = measure(lambda: index.sync(snapshot.content), 1)
+    report["search"], _ = measure(lambda: index.search("grandma jollof ric"), repeat)
+
+    pantry = ["rice", "tomato", "onion", "garlic", "chicken thigh"]
+    report["ingredient_index_build"], ingredients = measure(lambda: snapshot.ingredient_index, 1)
+    report["autocomplete"], _ = measure(lambda: ingredients.complete("to"), repeat)
+    report["cook_with"], _ = measure(lambda: ingredients.cook_with(pantry, PAGE_SIZE + 1), repeat)
+    report["cook_with_filtered"], _ = measure(
+        lambda: ingredients.cook_with(pantry, PAGE_SIZE + 1, tag_index.to_array(tag_index.query(selected))),
+        repeat,
+    )
+    report["similar_index_build"], similar = measure(lambda: snapshot.similarity_index, 1)
+    docnos = [tag_index.docnos[item.id] for item in items]
+    report["similar"], _ = measure(lambda: [similar.similar(docno) for docno in docnos], repeat)
+
+    # Write one heart and read the next snapshot, as a flush followed by a rerun
+    # does; this includes moving the post in the trending order
+    snapshots = SnapshotStore(storage)
+    snapshots._snapshot = snapshot
+    content_id = items[0].id
+    report["heart_round_trip"], _ = measure(
+        lambda: snapshots.add_hearts({content_id: 1}) and snapshots.current(), repeat
+    )
+    storage.close()
+    return report
+
+
+def bench_app(app_path, culture, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    def run(at):
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        return at
+
+    def timed(at, action=None):
+        start = time.perf_counter()
+        if action:
+            action(at)
+        run(at)
+        return (time.perf_counter() - start) * 1000
+
+    def widget(elements, label):
+        return next(element for element in elements if element.label.startswith(label))
+
+    def summary(times):
+        return {"median_ms": round(statistics.median(times), 3),
+                "min_ms": round(min(times), 3), "runs": len(times)}
+
+    report = {}
+    login = AppTest.from_file(str(app_path), default_timeout=600)
+    report["login_page_cold"] = summary([timed(login)])
+    report["login_page_rerun"] = summary([timed(login) for _ in range(repeat)])
+
+    def log_in(at):
+        widget(at.text_input, "Username").input("user0")
+        widget(at.text_input, "Password").input(PASSWORD)
+        widget(at.button, "Login").click()
+
+    times = []
+    for _ in range(repeat):
+        at = run(AppTest.from_file(str(app_path), default_timeout=600))
+        times.append(timed(at, log_in))
+        assert at.session_state["authenticated"], "login failed"
+    report["login"] = summary(times)
+
+    times = []
+    for attempt in range(repeat):
+        def register(at, username=f"bench{attempt}_{os.getpid()}"):
+            widget(at.text_input, "Choose Username").input(username)
+            widget(at.text_input, "Choose Password").input(PASSWORD)
+            widget(at.text_input, "Confirm Password").input(PASSWORD)
+            widget(at.text_input, "Email").input(f"{username}@example.com")
+            widget(at.button, "Register").click()
+
+        at = run(AppTest.from_file(str(app_path), default_timeout=600))
+        times.append(timed(at, register))
+        assert at.success, "registration failed"
+    report["register"] = summary(times)
+
+    browse = AppTest.from_file(str(app_path), default_timeout=600)
+    browse.session_state["authenticated"] = True
+    browse.session_state["current_user"] = "user0"
+    report["browse_cold"] = summary([timed(browse)])
+    report["browse_rerun"] = summary([timed(browse) for _ in range(repeat)])
+
+    def heart(at):
+        widget(at.button, "❤️").click()
+
+    report["heart_click"] = summary([timed(browse, heart) for _ in range(repeat)])
+
+    def search(query):
+        return lambda at: widget(at.text_input, "🔎").input(query)
+
+    report["search"] = summary([
+        timed(browse, search(query))
+        for query in ("grandma", "jollof ric", "festival memories", "pho", "stew")[:repeat]
+    ])
+    timed(browse, search(""))
+
+    def pantry(text):
+        return lambda at: widget(at.text_input, "🧺").input(text)
+
+    report["cook_with"] = summary([
+        timed(browse, pantry(text))
+        for text in ("rice, tomatoes, onion", "garlic, ginger", "chicken thighs, rice")[:repeat]
+    ])
+    timed(browse, pantry(""))
+
+    def filter_culture(values):
+        return lambda at: widget(at.multiselect, "Culture").set_value(values)
+
+    def order(label):
+        return lambda at: widget(at.radio, "Order").set_value(label)
+
+    report["trending"] = summary([timed(browse, order("🔥 Trending")) for _ in range(repeat)])
+    timed(browse, order("🆕 Newest"))
+
+    report["filter"] = summary([
+        timed(browse, filter_culture(values))
+        for values in ([culture], []) * repeat
+    ])
+    return report
+
+
+def worker(args):
+    """Benchmark a single corpus size and print its report as JSON."""
+    app_path = Path(args.app).resolve()
+    sys.path.insert(0, str(app_path.parent))
+    workdir = Path(tempfile.mkdtemp(prefix="culture-swap-bench-"))
+    # Removed at exit, after the app's own exit handlers have run
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.chdir(workdir)
+    data_dir = workdir / "data"
+    data_dir.mkdir()
+    users = args.users if args.users is not None else max(100, args.worker // 10)
+
+    start = time.perf_counter()
+    culture = make_corpus(data_dir, args.worker, users, args.seed)
+    report = {
+        "items": args.worker,
+        "users": users,
+        "generate_s": round(time.perf_counter() - start, 2),
+        "backend": bench_backend(data_dir, culture, args.repeat),
+    }
+    if not args.backend_only:
+        report["app"] = bench_app(app_path, culture, args.repeat)
+    print(json.dumps(report))
+
+
+def git_revision():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                            capture_output=True, text=True)
+    dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                           cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return result.stdout.strip() + ("-dirty" if dirty else "") if result.returncode == 0 else None
+
+
+def compare(base, new, threshold, noise_ms):
+    """``[(size, metric, base_ms, new_ms), ...]`` for every regressed median."""
+    regressions = []
+    for size, result in new["sizes"].items():
+        base_result = base["sizes"].get(size)
+        if base_result is None:
+            continue
+        for group in ("backend", "app"):
+            for metric, timing in result.get(group, {}).items():
+                before = base_result.get(group, {}).get(metric)
+                if before is None:
+                    continue
+                old_ms, new_ms = before["median_ms"], timing["median_ms"]
+                if new_ms > old_ms * (1 + threshold) and new_ms - old_ms > noise_ms:
+                    regressions.append((size, f"{group}.{metric}", old_ms, new_ms))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(ROOT / "app.py"))
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated corpus sizes")
+    parser.add_argument("--users", type=int, help="users per corpus (default size // 10)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend-only", action="store_true", help="skip the AppTest runs")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="report to check the new results against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--noise-ms", type=float, default=2.0)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        worker(args)
+        return
+
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    forwarded = ["--app", args.app, "--repeat", str(args.repeat), "--seed", str(args.seed)]
+    if args.users is not None:
+        forwarded += ["--users", str(args.users)]
+    if args.backend_only:
+        forwarded.append("--backend-only")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        print(f"Benchmarking {size} items...", file=sys.stderr)
+        result = subprocess.run(
+            [sys.executable, __file__, "--worker", str(size)] + forwarded,
+            stdout=subprocess.PIPE, text=True,
+        )
+        if result.returncode:
+            sys.exit(f"Benchmark of {size} items failed")
+        report["sizes"][str(size)] = json.loads(result.stdout.strip().splitlines()[-1])
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        base = json.loads(Path(args.compare).read_text())
+        regressions = compare(base, report, args.threshold, args.noise_ms)
+        for size, metric, old_ms, new_ms in regressions:
+            print(f"REGRESSION {size} items {metric}: {old_ms:.1f} ms -> {new_ms:.1f} ms",
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {base.get('revision') or args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
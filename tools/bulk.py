@@ -0,0 +1,95 @@
+"""Bulk import and export of recipes and stories as NDJSON.
+
+Usage:
+    python tools/bulk.py import archive.ndjson [--rejects rejects.ndjson]
+    python tools/bulk.py export [archive.ndjson] [--kind recipe]
+
+Both commands stream: an import reads one line at a time and commits every
+``--batch-size`` records, and an export writes rows as they are read, so a
+100k-post archive never has to fit in memory. Use ``-`` for stdin/stdout.
+Running apps pick imported posts up from the storage journal; the search
+index catches up the next time a page loads.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from culture_swap.bulk import BATCH_SIZE, export_ndjson, import_ndjson  # noqa: E402
+from culture_swap.storage import CONTENT_KINDS, open_storage  # noqa: E402
+
+
+def run_import(storage, args):
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    rejects_file = None
+
+    def progress(report):
+        print(f"\rline {report.lines}: {report.imported} imported, {report.skipped} already "
+              f"present, {report.rejected} rejected", end="", file=sys.stderr, flush=True)
+
+    # Rejected lines go straight to the file; it is only created if there are any
+    def on_reject(number, error, text):
+        nonlocal rejects_file
+        if rejects_file is None:
+            rejects_file = open(args.rejects, "w", encoding="utf-8")
+        rejects_file.write(json.dumps({"line": number, "error": error, "text": text}) + "\n")
+
+    try:
+        with source:
+            report = import_ndjson(storage, source, args.batch_size, progress,
+                                   on_reject if args.rejects else None)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+    print(file=sys.stderr)
+
+    for number, error in report.rejects[:args.show]:
+        print(f"line {number}: {error}", file=sys.stderr)
+    if report.rejected > args.show:
+        print(f"... and {report.rejected - args.show} more", file=sys.stderr)
+    return 1 if report.rejected else 0
+
+
+def run_export(storage, args):
+    kinds = [args.kind] if args.kind else CONTENT_KINDS
+    out = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8")
+    count = 0
+    with out:
+        for line in export_ndjson(storage, kinds):
+            out.write(line)
+            count += 1
+    print(f"{count} records exported", file=sys.stderr)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--backend", help="storage backend (default CULTURE_SWAP_STORAGE or sqlite)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="validate and insert an NDJSON archive")
+    importer.add_argument("file")
+    importer.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    importer.add_argument("--rejects", help="write rejected lines and their errors here")
+    importer.add_argument("--show", type=int, default=20, help="rejects to print")
+
+    exporter = commands.add_parser("export", help="write every post as NDJSON")
+    exporter.add_argument("file", nargs="?", default="-")
+    exporter.add_argument("--kind", choices=CONTENT_KINDS)
+
+    args = parser.parse_args()
+    Path(args.data_dir).mkdir(exist_ok=True)
+    storage = open_storage(args.data_dir, args.backend)
+    try:
+        run = run_import if args.command == "import" else run_export
+        sys.exit(run(storage, args))
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
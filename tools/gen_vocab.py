@@ -0,0 +1,33 @@
+"""Regenerate culture_swap/_countries.py from pycountry.
+
+Usage:
+    python tools/gen_vocab.py
+
+The app offers every country as a culture tag. Listing them from
+pycountry on each rerun means importing it and walking its database, so
+the names are written out once into a plain Python module instead.
+"""
+from pathlib import Path
+
+import pycountry
+
+OUTPUT = Path(__file__).resolve().parent.parent / "culture_swap" / "_countries.py"
+
+
+def main():
+    names = [country.name for country in pycountry.countries]
+    lines = [
+        f'"""Country names used as culture tags (pycountry {pycountry.__version__})."""',
+        "# Generated by tools/gen_vocab.py; do not edit.",
+        "",
+        "COUNTRY_NAMES = (",
+        *(f"    {name!r}," for name in names),
+        ")",
+        "",
+    ]
+    OUTPUT.write_text("\n".join(lines))
+    print(f"Wrote {len(names)} countries to {OUTPUT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Report what app.py pays in imports at cold start and on each rerun.
+
+Usage:
+    python tools/import_report.py [--app app.py] [--top 15] [--json]
+
+Run it on two revisions to compare them. The report has two parts:
+
+* import cost of app.py's top-level imports, measured in a fresh
+  interpreter with ``python -X importtime``;
+* wall time of the first (cold) run of the login page and of the Browse
+  page, and the mean of warm reruns, driven headlessly with AppTest.
+"""
+import argparse
+import ast
+import atexit
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def top_level_imports(app_path):
+    """Modules app.py imports unconditionally at module level."""
+    tree = ast.parse(Path(app_path).read_text())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def import_times(modules, cwd):
+    """``{module: cumulative µs}`` for each of ``modules``, in import order."""
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.rstrip()
+        # Top-level entries are the ones without indentation in the tree
+        if name.strip() in modules and not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def rerun_times(app_path, reruns):
+    """Cold and warm wall times of the login and Browse pages, in ms."""
+    from streamlit.testing.v1 import AppTest
+
+    def timed(at):
+        start = time.perf_counter()
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        return (time.perf_counter() - start) * 1000
+
+    report = {}
+    for page, state in (("login", {}), ("browse", {"authenticated": True, "current_user": "report"})):
+        at = AppTest.from_file(str(app_path), default_timeout=120)
+        for key, value in state.items():
+            at.session_state[key] = value
+        cold = timed(at)
+        warm = [timed(at) for _ in range(reruns)]
+        report[page] = {"cold_ms": round(cold, 1), "rerun_ms": round(statistics.mean(warm), 1)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(ROOT / "app.py"))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args()
+
+    app_path = Path(args.app).resolve()
+    modules = top_level_imports(app_path)
+    times = import_times(modules, app_path.parent)
+
+    # Run against a scratch data directory so real data is never touched.
+    # Removed at exit, after the app's own exit handlers have run.
+    workdir = tempfile.mkdtemp(prefix="import-report-")
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.chdir(workdir)
+    sys.path.insert(0, str(app_path.parent))
+    pages = rerun_times(app_path, args.reruns)
+
+    ranked = sorted(times.items(), key=lambda item: item[1], reverse=True)
+    report = {
+        "app": str(app_path),
+        "imports_total_ms": round(sum(times.values()) / 1000, 1),
+        "imports": {name: round(us / 1000, 1) for name, us in ranked[:args.top]},
+        "pages": pages,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Top-level imports of {report['app']}: {report['imports_total_ms']} ms")
+    for name, ms in report["imports"].items():
+        print(f"  {ms:8.1f} ms  {name}")
+    print("Page runs:")
+    for page, timing in pages.items():
+        print(f"  {page:7s} cold {timing['cold_ms']:8.1f} ms   rerun {timing['rerun_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()